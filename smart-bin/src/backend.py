@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+TFLite inference backends for the smart bin classifier.
+
+  * TFLiteBackend: one interpreter with a configurable thread count and
+    delegate, preprocessing via preprocess.InputWriter and per-invoke latency
+    tracking.
+  * BackendPool:   several interpreters for throughput mode; each predict()
+    borrows a free instance so concurrent callers never share one.
+
+Models are tried in order (e.g. int8 first, then float32) and the first one
+that loads is used. Settings come from a JSON config file and/or the CLI.
+"""
+import json
+import queue
+import time
+from collections import deque
+from pathlib import Path
+import numpy as np
+from preprocess import InputWriter
+from tracing import tracer
+
+MODEL_CHAIN = ["models/model_int8.tflite", "models/model.tflite", "models/model_f32.tflite"]
+
+DEFAULT_CONFIG = {
+    "models": MODEL_CHAIN,
+    "num_threads": 4,
+    "delegate": "xnnpack",   # "xnnpack", "none" or a path to an external delegate library
+    "pool_size": 1,
+}
+
+
+def _tflite():
+    try:
+        import tflite_runtime.interpreter as tflite
+    except ImportError:
+        # desktop / training machines: full TensorFlow
+        from tensorflow import lite as tflite
+    return tflite
+
+
+def latency_stats(latencies) -> dict:
+    """
+    Mean/p50/p95 invoke latency in milliseconds of a sequence of seconds.
+    """
+    if not latencies:
+        return {"count": 0}
+    ms = np.sort(np.fromiter(latencies, np.float64)) * 1e3
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+    }
+
+
+def make_interpreter(model_path, num_threads=None, delegate="xnnpack"):
+    """
+    Builds and allocates an interpreter. "xnnpack" keeps TFLite's default
+    XNNPACK delegate, "none" runs the builtin kernels only, anything else is
+    loaded as an external delegate library.
+    """
+    tflite = _tflite()
+    kwargs = {"model_path": str(model_path), "num_threads": num_threads}
+    if delegate == "none":
+        # tflite_runtime has OpResolverType at module level, TensorFlow under experimental
+        resolver = getattr(tflite, "OpResolverType", None) or tflite.experimental.OpResolverType
+        kwargs["experimental_op_resolver_type"] = resolver.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    elif delegate not in (None, "xnnpack"):
+        load_delegate = getattr(tflite, "load_delegate", None) or tflite.experimental.load_delegate
+        kwargs["experimental_delegates"] = [load_delegate(delegate)]
+    interpreter = tflite.Interpreter(**kwargs)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+class TFLiteBackend:
+    def __init__(self, model_path, num_threads=None, delegate="xnnpack", history=256):
+        self.model_path = Path(model_path)
+        self.num_threads = num_threads
+        self.delegate = delegate
+        self.interpreter = make_interpreter(model_path, num_threads, delegate)
+        self.input_writer = InputWriter(self.interpreter, self.interpreter.get_input_details()[0])
+        output = self.interpreter.get_output_details()[0]
+        self.output_index = output["index"]
+        self.output_scale, self.output_zero_point = output.get("quantization", (0.0, 0))
+        self.latencies = deque(maxlen=history)
+        self.batch_size = 1
+
+    @property
+    def input_shape(self):
+        return self.input_writer.shape
+
+    def _ensure_batch(self, n: int) -> None:
+        # resizing reallocates every tensor, so only do it when the batch size changes
+        if n != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_writer.index, [n, *self.input_shape])
+            self.interpreter.allocate_tensors()
+            self.batch_size = n
+
+    def _invoke(self) -> np.ndarray:
+        start = time.perf_counter()
+        self.interpreter.invoke()
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        tracer.record("invoke", elapsed)
+        output = self.interpreter.get_tensor(self.output_index)
+        if self.output_scale:
+            output = (output.astype(np.float32) - self.output_zero_point) * self.output_scale
+        return output
+
+    def predict(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Returns the (dequantized) output vector for one frame.
+        """
+        self._ensure_batch(1)
+        with tracer.span("preprocess"):
+            self.input_writer.write(frame)
+        return self._invoke()[0]
+
+    def predict_batch(self, frames) -> np.ndarray:
+        """
+        Classifies all `frames` in a single invoke; returns (n, classes).
+        """
+        self._ensure_batch(len(frames))
+        with tracer.span("preprocess"):
+            self.input_writer.write_batch(frames)
+        return self._invoke()
+
+    def latency_stats(self) -> dict:
+        return latency_stats(self.latencies)
+
+    def describe(self) -> str:
+        return f"{self.model_path.name} threads={self.num_threads} delegate={self.delegate}"
+
+
+class BackendPool:
+    """
+    Spreads predict() calls over several independent interpreters.
+    """
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+        self._free = queue.Queue()
+        for b in self.backends:
+            self._free.put(b)
+
+    @property
+    def model_path(self):
+        return self.backends[0].model_path
+
+    @property
+    def input_shape(self):
+        return self.backends[0].input_shape
+
+    def predict(self, frame: np.ndarray) -> np.ndarray:
+        backend = self._free.get()
+        try:
+            return backend.predict(frame)
+        finally:
+            self._free.put(backend)
+
+    def predict_batch(self, frames) -> np.ndarray:
+        backend = self._free.get()
+        try:
+            return backend.predict_batch(frames)
+        finally:
+            self._free.put(backend)
+
+    def latency_stats(self) -> dict:
+        return latency_stats([t for b in self.backends for t in list(b.latencies)])
+
+    def describe(self) -> str:
+        return f"pool of {len(self.backends)} x {self.backends[0].describe()}"
+
+
+def create_backend(models=MODEL_CHAIN, num_threads=None, delegate="xnnpack", pool_size=1):
+    """
+    Returns a backend for the first model in `models` that exists and loads.
+    """
+    errors = []
+    for model in models:
+        if not Path(model).exists():
+            continue
+        try:
+            backends = [TFLiteBackend(model, num_threads, delegate) for _ in range(max(1, pool_size))]
+        except (ValueError, RuntimeError, AttributeError) as e:
+            errors.append(f"{model}: {e}")
+            print(f"[Warning] could not load {model}, trying next model: {e}")
+            continue
+        return backends[0] if len(backends) == 1 else BackendPool(backends)
+    raise RuntimeError("no usable TFLite model in " + ", ".join(map(str, models))
+                       + ("; " + "; ".join(errors) if errors else ""))
+
+
+def load_config(path=None, **overrides) -> dict:
+    """
+    DEFAULT_CONFIG updated with a JSON file (if given) and non-None overrides.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        config.update(json.loads(Path(path).read_text()))
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+
+def add_backend_args(parser) -> None:
+    group = parser.add_argument_group("inference backend")
+    group.add_argument("--backend-config", help="JSON file with models/num_threads/delegate/pool_size")
+    group.add_argument("--model", dest="models", action="append",
+                       help="TFLite model to try, in order (repeatable)")
+    group.add_argument("--threads", dest="num_threads", type=int, help="interpreter threads")
+    group.add_argument("--delegate", help="xnnpack, none, or path to a delegate library")
+    group.add_argument("--pool", dest="pool_size", type=int, help="number of interpreters (throughput mode)")
+
+
+def config_from_args(args) -> dict:
+    return load_config(args.backend_config, models=args.models, num_threads=args.num_threads,
+                       delegate=args.delegate, pool_size=args.pool_size)
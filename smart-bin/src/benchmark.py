@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+On-device inference benchmark for the classifier models.
+
+Benchmarks every models/*.tflite (float32 and any quantized variants) at each
+requested thread count, plus models/saved_model through TensorFlow when it is
+installed. Each configuration runs in a fresh process: warm-up invocations,
+then N timed ones on synthetic frames or images replayed from --frames.
+Reports p50/p95/p99 latency, throughput and peak RSS as JSON together with
+host and model fingerprints, so runs can be compared with --compare.
+Run: python src/benchmark.py [--threads 1 2 4] [--runs 200] [--out bench.json]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+MODELS_DIR = Path("models")
+IMG_SIZE = 224
+
+
+def load_frames(frames_dir, count, size=IMG_SIZE):
+    """
+    Up to `count` RGB frames from frames_dir, or seeded random frames.
+    """
+    if frames_dir:
+        import cv2
+        frames = []
+        for p in sorted(Path(frames_dir).rglob("*")):
+            img = cv2.imread(str(p)) if p.suffix.lower() in (".jpg", ".jpeg", ".png") else None
+            if img is not None:
+                frames.append(cv2.cvtColor(cv2.resize(img, (size, size)), cv2.COLOR_BGR2RGB))
+            if len(frames) == count:
+                break
+        if frames:
+            return frames
+        print(f"[Warning] no images in {frames_dir}, using synthetic frames", file=sys.stderr)
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _saved_model_predict(path):
+    import tensorflow as tf
+    fn = tf.saved_model.load(str(path)).signatures["serving_default"]
+    name = list(fn.structured_input_signature[1])[0]
+
+    def predict(frame):
+        # same normalization as preprocess.InputWriter uses for float models
+        x = tf.convert_to_tensor(frame[None].astype(np.float32) / 127.5 - 1.0)
+        return fn(**{name: x})
+    return predict
+
+
+def run_config(model, num_threads, frames_dir, warmup, runs):
+    """
+    Executed in a child process so peak RSS belongs to this configuration only.
+    """
+    frames = load_frames(frames_dir, 32)
+    if Path(model).is_dir():
+        predict = _saved_model_predict(model)
+    else:
+        from backend import TFLiteBackend
+        predict = TFLiteBackend(model, num_threads=num_threads).predict
+    for i in range(warmup):
+        predict(frames[i % len(frames)])
+    times = np.empty(runs)
+    start = time.perf_counter()
+    for i in range(runs):
+        t = time.perf_counter()
+        predict(frames[i % len(frames)])
+        times[i] = time.perf_counter() - t
+    wall = time.perf_counter() - start
+    ms = times * 1e3
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_fps": runs / wall,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def fingerprint(path):
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def host_info():
+    info = {"machine": platform.machine(), "platform": platform.platform(),
+            "python": platform.python_version(), "node": platform.node()}
+    try:
+        import tflite_runtime
+        info["tflite_runtime"] = tflite_runtime.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def discover(models_dir, with_saved_model):
+    models = sorted(str(p) for p in Path(models_dir).glob("*.tflite"))
+    saved = Path(models_dir)/"saved_model"
+    if with_saved_model and (saved/"saved_model.pb").exists():
+        try:
+            import tensorflow  # noqa: F401
+            models.append(str(saved))
+        except ImportError:
+            print("[Info] TensorFlow not installed, skipping SavedModel", file=sys.stderr)
+    return models
+
+
+def compare(results, previous_path, tolerance):
+    """
+    Prints configurations whose p50 latency got worse by more than `tolerance`.
+    Returns the number of regressions.
+    """
+    previous = {(Path(r["model"]).name, r["threads"]): r
+                for r in json.loads(Path(previous_path).read_text())["results"]}
+    regressions = 0
+    for r in results:
+        old = previous.get((Path(r["model"]).name, r["threads"]))
+        if old is None:
+            continue
+        change = r["p50_ms"] / old["p50_ms"] - 1.0
+        flag = "REGRESSION" if change > tolerance else "ok"
+        if old["fingerprint"] != r["fingerprint"]:
+            flag += " (model changed)"
+        regressions += change > tolerance
+        print(f"{Path(r['model']).name:<24} t={r['threads']}  p50 {old['p50_ms']:.2f} → {r['p50_ms']:.2f} ms "
+              f"({change:+.1%})  {flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", help="models to benchmark (default: everything in models/)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--frames", help="directory of recorded frames (default: synthetic)")
+    parser.add_argument("--no-saved-model", action="store_true")
+    parser.add_argument("--out", type=Path, help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", type=Path, help="previous JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    models = args.models or discover(MODELS_DIR, not args.no_saved_model)
+    ctx = mp.get_context("spawn")
+    results = []
+    for model in models:
+        # the SavedModel path has no thread knob here, run it once
+        for threads in ([None] if Path(model).is_dir() else args.threads):
+            with ctx.Pool(1) as pool:
+                r = pool.apply(run_config, (model, threads, args.frames, args.warmup, args.runs))
+            r.update(model=model, threads=threads, fingerprint=fingerprint(model))
+            print(f"{Path(model).name:<24} t={threads}  p50 {r['p50_ms']:.2f}  p95 {r['p95_ms']:.2f}  "
+                  f"p99 {r['p99_ms']:.2f} ms  {r['throughput_fps']:.1f} fps  rss {r['peak_rss_mb']:.0f} MB",
+                  file=sys.stderr)
+            results.append(r)
+
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "host": host_info(),
+              "warmup": args.warmup, "runs": args.runs, "frames": args.frames or "synthetic",
+              "results": results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text)
+    else:
+        print(text)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,35 +2,129 @@
 """
 Real-time image classification using TFLite and Picamera2 on Raspberry Pi.
 
-Loads the TFLite model at models/model.tflite, captures frames via Picamera2,
+Loads the first available TFLite model (see backend.MODEL_CHAIN), captures frames via Picamera2,
 performs inference to classify waste into one of four bins,
 prints the class names, and routes hardware control via hardware_control.pick_bin().
 
+The model, camera and servo driver are only loaded when main() runs; model
+warm-up overlaps camera and servo initialisation and a per-phase startup
+timing line is printed.
+
 Use `--debug` to display the video with overlaid predictions (press 'q' to quit).
+Use `--sim DIR_OR_VIDEO` to run on a workstation: frames are replayed from
+images or a video and the servos and ultrasonic sensor are simulated
+(see smartbin/sim.py); `--sim-speed` runs simulated time faster than real time.
 """
+import os
 import time
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
-from picamera2 import Picamera2
-import cv2
-from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter
-from smartbin import SmartBin
-import readchar
+from pipeline import Pipeline
+from backend import create_backend, load_config, add_backend_args, config_from_args
+from decision import BurstVoter, add_vote_args, voter_from_args
+from trigger import PresenceTrigger, add_trigger_args, trigger_from_args
+from crops import propose_crops, fuse
+from tracing import tracer, add_tracing_args, setup_tracing
+from event_log import EventLog, EVENT_LOG_PATH
+from outbox import add_outbox_args, outbox_from_args
+from hard_examples import add_hard_example_args, hard_examples_from_args
+from embedding_cache import add_cache_args, cache_from_args, model_id
 
 # Configuration
 IMG_SIZE = 224
-LABELS = Path("data/labels.txt").read_text().splitlines()
+LABELS_PATH = Path("data/labels.txt")
+FILL_STATE_PATH = Path("data/fill_state.json")
+
+
+class Classifier:
+    """
+    TFLite classifier that reads labels and builds the inference backend on
+    first use, so importing this module touches neither the model nor the
+    hardware. `config` is a backend.load_config() dict.
+
+    Frames larger than the model input are split into `crops` region
+    proposals (see crops.py) that are classified in one batched invoke.
+    `background` may return the empty-tray thumbnail to guide the proposals.
+    An embedding_cache.EmbeddingCache in `cache` answers near-identical
+    items without running the model; it fingerprints the item against the
+    `background` thumbnail and is bypassed without one.
+    """
+
+    def __init__(self, config=None, labels_path=LABELS_PATH, crops=4, background=None, cache=None):
+        self.config = config or load_config()
+        self.labels_path = Path(labels_path)
+        self.crops = crops
+        self.background = background
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self) -> "Classifier":
+        with self._lock:
+            if self._loaded:
+                return self
+            self.labels = self.labels_path.read_text().splitlines()
+            self.backend = create_backend(**self.config)
+            print(f"[Info] inference backend: {self.backend.describe()}")
+            self._loaded = True
+        return self
+
+    def warm_up(self, frame_shape=None) -> None:
+        """
+        Runs one invoke on a blank frame so the first real item does not pay
+        for kernel preparation, page-ins of the model file or a batch resize.
+        """
+        self.load()
+        self.predict(np.zeros(frame_shape or self.backend.input_shape, np.uint8))
+
+    def scores(self, frame: np.ndarray) -> np.ndarray:
+        if not self._loaded:
+            self.load()
+        if self.cache is not None:
+            return self.cache.scores(frame, self._scores, self._background())
+        return self._scores(frame)
+
+    def _background(self):
+        return self.background() if self.background is not None else None
 
-# Initialize interpreter
-tflite_model_path = "models/model.tflite"
-interpreter = TFLiteInterpreter(model_path=tflite_model_path)
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-input_index = input_details[0]['index']
-output_index = output_details[0]['index']
-input_dtype = input_details[0]['dtype']
+    def forget(self, frame: np.ndarray) -> None:
+        """
+        Evicts cached answers for the item in `frame` (after an operator override).
+        """
+        if self.cache is not None:
+            self.cache.evict(frame, self._background())
+
+    def _scores(self, frame: np.ndarray) -> np.ndarray:
+        if frame.shape == self.backend.input_shape:
+            return self.backend.predict(frame)
+        background = self._background()
+        with tracer.span("crops"):
+            crops = propose_crops(frame, self.backend.input_shape[0], self.crops, background)
+        return fuse(self.backend.predict_batch(crops))
+
+    def predict(self, frame: np.ndarray) -> tuple[int, float]:
+        output = self.scores(frame)
+        return int(np.argmax(output)), float(max(output))
+
+
+classifier = Classifier()
+voter = BurstVoter()
+# smartbin.sim.Camera arguments when replaying frames instead of using Picamera2
+sim_camera = None
+# EventLog of routed items, opened by main()
+event_log = None
+# outbox.Outbox shipping events (and frames below upload_frames_below) to a collector
+outbox = None
+upload_frames_below = 0.6
+# seconds a flap stays open in --pipeline mode; None = SmartBin.DWELL
+dwell = None
+# hard_examples.HardExampleStore for low-confidence / operator-corrected frames
+hard_examples = None
+# operator keys -> class name; the item goes to that class's compartment, as in --pipeline
+OPERATOR_KEYS = {"c": "compost", "e": "electronics", "r": "recycle", "t": "trash"}
 
 
 def show_info(text):
@@ -38,72 +132,208 @@ def show_info(text):
     print(text)
 
 # Camera setup using Picamera2
-def open_camera():
-    picam2 = Picamera2()
+def open_camera(size=(IMG_SIZE, IMG_SIZE)):
+    if sim_camera is not None:
+        from smartbin.sim import Camera as Picamera2
+        picam2 = Picamera2(**sim_camera)
+    else:
+        from picamera2 import Picamera2
+        picam2 = Picamera2()
     config = picam2.create_preview_configuration(
-        main={"size": (IMG_SIZE, IMG_SIZE), "format": "RGB888"}
+        main={"size": tuple(size), "format": "RGB888"}
     )
     picam2.configure(config)
     picam2.start()
-    print("[Info] Picamera2 started with 224x224 RGB output")
+    print(f"[Info] Picamera2 started with {size[0]}x{size[1]} RGB output")
     return picam2
 
-# Preprocessing (uint8 or float32 scaled to [-1,1])
-def preprocess_image(img: np.ndarray) -> np.ndarray:
-    if input_dtype == np.uint8:
-        return img.astype(np.uint8)
-    else:
-        img_f32 = img.astype(np.float32)
-        return (img_f32 / 127.5) - 1.0
 
-# Prediction routine
-def predict(frame: np.ndarray) -> tuple[int, int]:
-    tensor = preprocess_image(frame)
-    tensor = np.expand_dims(tensor, axis=0).astype(input_dtype)
-    interpreter.set_tensor(input_index, tensor)
-    interpreter.invoke()
-    output = interpreter.get_tensor(output_index)[0]
+def open_bin():
+    from smartbin import SmartBin
+    return SmartBin(fill_state=str(FILL_STATE_PATH))
+
+
+def log_item(bin, decision, compartment, source="model", frame=None, label=None) -> None:
+    """
+    Records one routed item. `label` is the class an operator chose; the
+    event log then counts the item under that class, not the prediction.
+    """
+    cls_id = classifier.labels.index(label) if label is not None else decision.cls_id
+    if event_log is not None:
+        event_log.log(cls_id, decision.confidence, decision.latency, compartment,
+                      bin.fullness.distance, source)
+    if outbox is not None:
+        event = {"cls": cls_id, "predicted": decision.cls_id, "confidence": round(decision.confidence, 4),
+                 "latency_ms": round(decision.latency * 1e3, 1), "compartment": compartment,
+                 "distance_cm": bin.fullness.distance, "source": source}
+        outbox.put_event(event)
+        if frame is not None and decision.confidence < upload_frames_below:
+            outbox.put_frame(frame, event)
+    if hard_examples is not None and frame is not None:
+        predicted = classifier.labels[decision.cls_id]
+        hard_examples.capture(frame, decision.cls_id, predicted, decision.confidence, label=label,
+                              overridden=label is not None and label != predicted)
+    if frame is not None and label is not None and label != classifier.labels[decision.cls_id]:
+        # the answer may have come from the cache; do not serve it again
+        classifier.forget(frame)
+
 
-    return int(np.argmax(output)), max(output)
+def print_fill(bin) -> None:
+    for c in bin.fill_report():
+        eta = "-" if c["eta_s"] is None else f"{c['eta_s'] / 3600:.1f} h"
+        print(f"[Info] {classifier.labels[c['compartment']]:<12} {c['fill']:>4.0%} full, "
+              f"{c['items_per_hour']:.1f} items/h, full in {eta}")
+
+
+# Prediction routine (preprocessing writes into the input tensor, see preprocess.py)
+def predict(frame: np.ndarray) -> tuple[int, float]:
+    return classifier.predict(frame)
+
+
+def startup(capture_size=(IMG_SIZE, IMG_SIZE)):
+    """
+    Warms up the model while the camera and the servos initialise, and prints
+    how long each phase took. Returns (camera, bin).
+    """
+    frame_shape = (capture_size[1], capture_size[0], 3)
+    t0 = time.monotonic()
+    timings = {}
+
+    def timed(name, fn):
+        start = time.monotonic()
+        result = fn()
+        timings[name] = time.monotonic() - start
+        return result
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        model = pool.submit(timed, "model", lambda: classifier.warm_up(frame_shape))
+        cam = pool.submit(timed, "camera", lambda: open_camera(capture_size))
+        bin = pool.submit(timed, "servos", open_bin)
+        model.result()
+        cam, bin = cam.result(), bin.result()
+
+    timings["total"] = time.monotonic() - t0
+    print("[Info] startup " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    return cam, bin
+
+
+# Pipelined loop: capture, inference and actuation overlap
+def run_pipeline(cam, bin, trigger, depth: int = 2) -> None:
+    timed_capture = tracer.timed("capture", cam.capture_array)
+    camera_lock = threading.Lock()
+
+    def capture_frame():
+        # the trigger (capture thread) and the voter (inference threads) share the camera
+        with camera_lock:
+            return timed_capture()
+
+    # capture blocks until an item lands and hands over its first frame
+    capture = lambda: trigger.wait(capture_frame)
+
+    def infer(frame):
+        with tracer.span("decision"):
+            # further frames of the burst are captured only if the vote needs them
+            return voter.decide(classifier.scores, frame, capture_frame)
+
+    def actuate(frame, decision):
+        print(f"Predicted: {classifier.labels[decision.cls_id]}, confidence: {round(decision.confidence, 2)} "
+              f"({decision.frames} frames, {decision.latency * 1e3:.0f} ms)")
+        with tracer.span("fullness"):
+            full = bin.check_fullness()
+        if full:
+            print(f"[Warning] bin is full ({bin.fullness.distance:.1f} cm), stopping")
+            return False
+        with tracer.span("actuation"):
+            bin.open(decision.cls_id).join()
+            bin.dwell(dwell)
+            bin.close_all().join()
+        log_item(bin, decision, decision.cls_id, frame=frame)
+
+    pipe = Pipeline(capture, infer, actuate, depth=depth,
+                    infer_workers=classifier.config.get("pool_size", 1))
+    try:
+        pipe.run()
+    finally:
+        pipe.stop()
+        print(f"[Info] {pipe.counts['actuated']} items, {pipe.items_per_min():.1f} items/min")
+        print(f"[Info] invoke latency: {classifier.backend.latency_stats()}")
+        print(f"[Info] {voter.frames_per_item():.2f} frames/item, {voter.stats['early_exits']} early exits")
+        for stage, stats in tracer.summary().items():
+            print(f"[Info] {stage:<10} {stats}")
+        print_fill(bin)
 
 
 # Main loop
-def main(debug: bool = False):
-    cam = open_camera()
-    bin = SmartBin()
+def main(debug: bool = False, pipeline: bool = False, trigger=None, capture_size=(IMG_SIZE, IMG_SIZE),
+         event_log_path=EVENT_LOG_PATH, cache=None, cache_path=None):
+    global event_log
+    import cv2
+    import readchar
+    cam, bin = startup(capture_size)
+    if cache is not None and trigger is None and not pipeline:
+        print("[Warning] --cache needs the empty-tray background of --trigger, cache disabled")
+        cache = None
+    if cache is not None:
+        # attached after the warm-up so the blank frame is not remembered
+        if cache_path:
+            cache.open(cache_path, model_id(classifier.backend.model_path))
+        classifier.cache = cache
+    if event_log_path:
+        event_log = EventLog(event_log_path)
+    if pipeline and trigger is None:
+        trigger = PresenceTrigger()
+    if trigger is not None:
+        classifier.background = lambda: trigger.background
+        if trigger.ultrasonic_cm is not None:
+            trigger.use_distance(bin.get_distance, trigger.ultrasonic_cm)
     try:
+        if pipeline:
+            run_pipeline(cam, bin, trigger=trigger)
+            return
+
         while True:
 
             if True:
                 while True:
                     frame = cam.capture_array()
-                    cls_id, confidence = predict(frame)
-                    cls_name = LABELS[cls_id]
-                    cv2.putText(frame, cls_name + ", " + str(round(confidence, 5)), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, .5 , (0,255,0), 2)
-                    cv2.imshow("Classification", frame)
+                    if trigger is None:
+                        cls_id, confidence = predict(frame)
+                        text = classifier.labels[cls_id] + ", " + str(round(confidence, 5))
+                    else:
+                        text = "waiting for an item"  # classified once trigger.wait() fires below
+                    preview = frame.copy()  # keep the overlay off frames that are classified or saved
+                    cv2.putText(preview, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, .5 , (0,255,0), 2)
+                    cv2.imshow("Classification", preview)
                     if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
 
-            frame = cam.capture_array()
-            cls_id, confidence = predict(frame)
-            cls_name = LABELS[cls_id]
-            print(f"Predicted: {cls_name}, confidence: {round(confidence, 2)}")
+            capture = tracer.timed("capture", cam.capture_array)
+            if trigger is not None:
+                # nothing is classified until an item lands and holds still
+                frame = trigger.wait(capture)
+            else:
+                frame = capture()
+            with tracer.span("decision"):
+                # further frames are captured only if the vote needs them
+                decision = voter.decide(classifier.scores, frame, capture)
+            cls_id, confidence = decision.cls_id, decision.confidence
+            cls_name = classifier.labels[cls_id]
+            print(f"Predicted: {cls_name}, confidence: {round(confidence, 2)} ({decision.frames} frames)")
             
-            is_full = bin.check_fullness()
+            with tracer.span("fullness"):
+                is_full = bin.check_fullness()
 
             if is_full:
+                print_fill(bin)
                 return
             
             show_info("Press \n\t(c)ompost\n\t(e)lectronics\n\t(r)ecyclable\n\t(t)rash\n to open a partition")
             key = readchar.readkey()
-            if key == "c":
-                bin.open(0)
-            elif key == "e":
-                bin.open(1)
-            elif key == "r":
-                bin.open(2)
-            elif key == "t":
-                bin.open(3)
+            if key in OPERATOR_KEYS:
+                label = OPERATOR_KEYS[key]
+                compartment = classifier.labels.index(label)
+                bin.open(compartment)
+                log_item(bin, decision, compartment, source="operator", frame=frame, label=label)
             
             #bin.open(cls_id)
 
@@ -111,11 +341,23 @@ def main(debug: bool = False):
             while True:
                 key = readchar.readkey()
                 if key == "s":
-                    bin.close_all()
+                    bin.close_all().join()
                     break
             
     finally:
         cam.stop()
+        bin.close()
+        tracer.stop()
+        if event_log is not None:
+            event_log.close()
+        if outbox is not None:
+            outbox.close()
+        if hard_examples is not None:
+            print(f"[Info] hard examples: {hard_examples.stats}")
+            hard_examples.close()
+        if classifier.cache is not None:
+            print(f"[Info] embedding cache: {classifier.cache.report()}")
+            classifier.cache.save()
         if debug:
             cv2.destroyAllWindows()
 
@@ -123,6 +365,47 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--debug", action="store_true",
                         help="Display camera feed with overlay")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Route items automatically with overlapped capture/inference/actuation "
+                             "(implies --trigger)")
+    parser.add_argument("--dwell", type=float, metavar="SECONDS",
+                        help="how long --pipeline keeps a flap open before closing it (default 1.0)")
+    add_backend_args(parser)
+    add_vote_args(parser)
+    add_trigger_args(parser)
+    add_tracing_args(parser)
+    add_outbox_args(parser)
+    add_hard_example_args(parser)
+    add_cache_args(parser)
+    parser.add_argument("--multi-crop", type=int, metavar="N", default=0,
+                        help="capture at --capture-size and classify N region crops in one batch")
+    parser.add_argument("--capture-size", default="640x480", help="camera resolution for --multi-crop (WxH)")
+    parser.add_argument("--event-log", default=str(EVENT_LOG_PATH),
+                        help="SQLite log of routed items ('' to disable)")
+    parser.add_argument("--sim", metavar="SOURCE",
+                        help="simulate the hardware, replaying frames from an image directory or video")
+    parser.add_argument("--sim-fps", type=float, default=15.0, help="replay rate of --sim frames (0 = unpaced)")
+    parser.add_argument("--sim-speed", type=float, default=1.0, help="speed-up of simulated time (servo motion, frame rate)")
     args = parser.parse_args()
-    main(debug=args.debug)
+    if args.pipeline:
+        # without the presence gate every frame of an empty tray would be routed
+        args.trigger = True
+    if args.sim:
+        # must be set before smartbin is imported
+        os.environ["SMARTBIN_SIM"] = "1"
+        os.environ["SMARTBIN_SIM_SPEED"] = str(args.sim_speed)
+        sim_camera = {"source": args.sim, "fps": args.sim_fps}
+    setup_tracing(args)
+    outbox = outbox_from_args(args)
+    upload_frames_below = args.upload_frames_below
+    dwell = args.dwell
+    hard_examples = hard_examples_from_args(args)
+    classifier.config = config_from_args(args)
+    voter = voter_from_args(args)
+    capture_size = (IMG_SIZE, IMG_SIZE)
+    if args.multi_crop:
+        classifier.crops = args.multi_crop
+        capture_size = tuple(int(v) for v in args.capture_size.lower().split("x"))
+    main(debug=args.debug, pipeline=args.pipeline, trigger=trigger_from_args(args), capture_size=capture_size,
+         event_log_path=args.event_log, cache=cache_from_args(args), cache_path=args.cache_path)
 
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Reference collector for outbox uploads, for local testing.
+
+Accepts POST /ingest bodies produced by outbox.py (gzip-compressed record
+segments) on keep-alive HTTP/1.1 connections. Events are appended to
+<out>/<bin id>/events.jsonl; frames are written to <out>/<bin id>/frames/ and
+listed with their metadata in frames.jsonl. Batch ids already received are
+acknowledged without storing them again, so retries are harmless.
+Run: python src/collector.py [--port 8765] [--out collected]
+"""
+import argparse
+import gzip
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from outbox import iter_records
+
+SAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class Collector:
+    def __init__(self, out):
+        self.out = Path(out)
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def _bin_dir(self, bin_id):
+        d = self.out/(SAFE.sub("_", bin_id) or "unknown")
+        (d/"frames").mkdir(parents=True, exist_ok=True)
+        if bin_id not in self._seen:
+            seen = d/"batches.txt"
+            self._seen[bin_id] = set(seen.read_text().split()) if seen.exists() else set()
+        return d
+
+    def ingest(self, bin_id, batch_id, body) -> dict:
+        data = gzip.decompress(body)
+        batch_id = SAFE.sub("_", batch_id)
+        with self._lock:
+            d = self._bin_dir(bin_id)
+            if batch_id and batch_id in self._seen[bin_id]:
+                return {"accepted": 0, "duplicate": True}
+            events = frames = 0
+            with open(d/"events.jsonl", "a") as ev, open(d/"frames.jsonl", "a") as fr:
+                for i, (meta, payload) in enumerate(iter_records(data)):
+                    if meta.get("kind") == "frame":
+                        name = f"{batch_id}-{i}.jpg"
+                        (d/"frames"/name).write_bytes(payload)
+                        fr.write(json.dumps(dict(meta, file=name)) + "\n")
+                        frames += 1
+                    else:
+                        ev.write(json.dumps(meta) + "\n")
+                        events += 1
+            if batch_id:
+                self._seen[bin_id].add(batch_id)
+                with open(d/"batches.txt", "a") as f:
+                    f.write(batch_id + "\n")
+        return {"accepted": events + frames, "events": events, "frames": frames}
+
+
+def make_handler(collector):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, one connection per bin
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.rstrip("/") != "/ingest":
+                return self._reply(404, {"error": "not found"})
+            try:
+                result = collector.ingest(self.headers.get("X-Bin-Id", "unknown"),
+                                          self.headers.get("X-Batch-Id", ""), body)
+            except (OSError, ValueError, EOFError) as e:
+                return self._reply(400, {"error": str(e)})
+            self._reply(200, result)
+
+        def log_message(self, fmt, *args):
+            print(f"[Info] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+def serve(port=8765, out="collected", host="0.0.0.0"):
+    server = ThreadingHTTPServer((host, port), make_handler(Collector(out)))
+    print(f"[Info] collector listening on http://{host}:{port}/ingest, writing to {out}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default="collected")
+    args = parser.parse_args()
+    server = serve(args.port, args.out, args.host)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Streaming tf.data input pipeline for training and evaluation.
+
+Images are read either from data/images/<class>/*.jpg or from the shards of
+`prepare_data.py --format shards`, decoded in parallel, optionally cached to
+files on disk (never in RAM), shuffled, augmented on the CPU and batched.
+Cache files are named after a digest of the source files, so a changed
+dataset is decoded afresh instead of being read from a stale cache.
+Batches are (float32 images in 0–255, int32 labels), the same contract as
+tf.keras.utils.image_dataset_from_directory.
+"""
+import hashlib
+import time
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+import shards
+
+AUTOTUNE = tf.data.AUTOTUNE
+IMG_SIZE = 224
+VAL_FRACTION = 0.2
+SEED = 42
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def source_digest(source):
+    """
+    Hash of the file list (path, size, mtime) under `source`, which changes
+    whenever images or shards are added, removed or rewritten.
+    """
+    h = hashlib.sha1()
+    for p in sorted(Path(source).rglob("*")):
+        if p.is_file():
+            st = p.stat()
+            h.update(f"{p.relative_to(source)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def list_images(data_dir):
+    """
+    Sorted (paths, labels, class_names) of data_dir/<class>/*.
+    """
+    data_dir = Path(data_dir)
+    class_names = sorted(p.name for p in data_dir.iterdir() if p.is_dir())
+    paths, labels = [], []
+    for label, cls in enumerate(class_names):
+        for p in sorted((data_dir/cls).iterdir()):
+            if p.suffix.lower() in IMAGE_EXTS:
+                paths.append(str(p))
+                labels.append(label)
+    return paths, labels, class_names
+
+
+def split(paths, labels, subset, val_fraction=VAL_FRACTION, seed=SEED):
+    """
+    Deterministic train/validation split shared by every script.
+    """
+    is_val = np.random.default_rng(seed).random(len(paths)) < val_fraction
+    keep = is_val if subset == "validation" else ~is_val
+    return [p for p, k in zip(paths, keep) if k], [l for l, k in zip(labels, keep) if k]
+
+
+def decode(path, label):
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, (IMG_SIZE, IMG_SIZE))
+    return tf.cast(tf.clip_by_value(img, 0, 255), tf.uint8), label
+
+
+def augment(img, label):
+    """
+    Cheap CPU-side augmentation on uint8 images.
+    """
+    img = tf.image.random_flip_left_right(img)
+    img = tf.image.resize_with_crop_or_pad(img, IMG_SIZE + 16, IMG_SIZE + 16)
+    img = tf.image.random_crop(img, (IMG_SIZE, IMG_SIZE, 3))
+    img = tf.cast(img, tf.float32)
+    img = tf.image.random_brightness(img, 25.0)
+    img = tf.image.random_contrast(img, 0.8, 1.2)
+    return tf.cast(tf.clip_by_value(img, 0, 255), tf.uint8), label
+
+
+def _directory_records(data_dir, subset):
+    paths, labels, class_names = list_images(data_dir)
+    paths, labels = split(paths, labels, subset)
+    ds = tf.data.Dataset.from_tensor_slices((paths, tf.constant(labels, tf.int32)))
+    if subset == "training":
+        # shuffle file names up front too, so the cache fill pass is not class-sorted
+        ds = ds.shuffle(len(paths), seed=SEED)
+    return ds.map(decode, num_parallel_calls=AUTOTUNE), class_names
+
+
+def _shard_records(shard_dir, subset, cycle_length=4):
+    index = shards.load_index(shard_dir)
+    size = index["image_size"]
+    signature = (tf.TensorSpec((size, size, 3), tf.uint8), tf.TensorSpec((), tf.int32))
+
+    def one_shard(shard_no):
+        return tf.data.Dataset.from_generator(
+            shards.iter_shard, output_signature=signature,
+            args=(str(shard_dir), shard_no, subset, subset == "training"))
+
+    ds = tf.data.Dataset.range(len(index["shards"]))
+    if subset == "training":
+        ds = ds.shuffle(len(index["shards"]), seed=SEED)
+    ds = ds.interleave(one_shard, cycle_length=cycle_length, num_parallel_calls=AUTOTUNE,
+                       deterministic=subset != "training")
+    if size != IMG_SIZE:
+        ds = ds.map(lambda x, y: (tf.cast(tf.image.resize(x, (IMG_SIZE, IMG_SIZE)), tf.uint8), y),
+                    num_parallel_calls=AUTOTUNE)
+    return ds, index["classes"]
+
+
+def make_dataset(source, subset, batch=32, shards_dir=None, cache_dir=None, augment_data=False,
+                 shuffle_buffer=1000, drop_remainder=False):
+    """
+    source:         data/images directory (ignored when shards_dir is set).
+    subset:         "training" or "validation".
+    cache_dir:      if set, decoded uint8 images are cached to files there.
+    drop_remainder: fixed batch shapes (mixed precision / XLA friendly).
+    Returns (dataset, class_names).
+    """
+    if shards_dir:
+        ds, class_names = _shard_records(shards_dir, subset)
+    else:
+        ds, class_names = _directory_records(source, subset)
+    if cache_dir:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        root = Path(shards_dir or source)
+        prefix = f"{root.name}-{subset}-"
+        name = prefix + source_digest(root)[:16]
+        for old in cache_dir.glob(prefix + "*"):
+            if not old.name.startswith(name):
+                old.unlink()  # cache of an earlier version of the dataset
+        ds = ds.cache(str(cache_dir/name))
+    if subset == "training":
+        ds = ds.shuffle(shuffle_buffer, seed=SEED)
+        if augment_data:
+            ds = ds.map(augment, num_parallel_calls=AUTOTUNE)
+    ds = ds.batch(batch, drop_remainder=drop_remainder, num_parallel_calls=AUTOTUNE)
+    ds = ds.map(lambda x, y: (tf.cast(x, tf.float32), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE), class_names
+
+
+def benchmark(ds, batches=100, epochs=2):
+    """
+    Iterates `ds` without training and prints images/sec per epoch (the first
+    epoch fills the cache, later ones read it).
+    """
+    for epoch in range(epochs):
+        n, start = 0, time.perf_counter()
+        for images, _ in ds.take(batches):
+            n += int(images.shape[0])
+        elapsed = time.perf_counter() - start
+        print(f"epoch {epoch}: {n} images in {elapsed:.2f}s → {n / max(elapsed, 1e-9):.1f} images/s")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Multi-frame decision engine for routing an item.
+
+Classifies a short burst of frames and aggregates the class probabilities,
+either as an exponential moving average ("ema") or by averaging log
+probabilities ("logit"). The burst stops as soon as the aggregate
+confidence reaches the threshold, so easy items decide on the first frame
+and only ambiguous ones pay for more.
+
+Knobs (latency vs accuracy):
+  max_frames  upper bound on frames per item
+  min_frames  frames always taken before an early exit is allowed
+  threshold   aggregate confidence needed to stop early
+  max_latency seconds after which the current best guess is used
+"""
+import threading
+import time
+from typing import NamedTuple
+import numpy as np
+
+VOTE_MODES = ("ema", "logit")
+
+
+class Decision(NamedTuple):
+    cls_id: int
+    confidence: float
+    frames: int
+    latency: float
+    probs: np.ndarray
+
+
+def _softmax(z):
+    z = z - z.max()
+    e = np.exp(z)
+    return e / e.sum()
+
+
+class BurstVoter:
+    def __init__(self, max_frames: int = 5, min_frames: int = 1, threshold: float = 0.85,
+                 mode: str = "logit", alpha: float = 0.6, max_latency: float = None):
+        if mode not in VOTE_MODES:
+            raise ValueError(f"unknown vote mode {mode!r}, expected one of {VOTE_MODES}")
+        self.max_frames = max(1, max_frames)
+        self.min_frames = max(1, min(min_frames, self.max_frames))
+        self.threshold = threshold
+        self.mode = mode
+        self.alpha = alpha
+        self.max_latency = max_latency
+        self.stats = {"items": 0, "frames": 0, "early_exits": 0}
+        self._stats_lock = threading.Lock()  # decide() runs on several inference threads
+
+    def decide(self, scores, first_frame, next_frame) -> Decision:
+        """
+        scores(frame) -> probability vector; next_frame() -> another frame.
+        """
+        start = time.monotonic()
+        frame = first_frame
+        agg = None
+        n = 0
+        while True:
+            p = np.asarray(scores(frame), dtype=np.float64)
+            n += 1
+            if self.mode == "ema":
+                agg = p if agg is None else self.alpha * p + (1 - self.alpha) * agg
+                probs = agg / agg.sum()
+            else:
+                logp = np.log(np.clip(p, 1e-7, 1.0))
+                agg = logp if agg is None else agg + logp
+                probs = _softmax(agg / n)
+            confidence = float(probs.max())
+            elapsed = time.monotonic() - start
+            early = n >= self.min_frames and confidence >= self.threshold
+            if early or n >= self.max_frames or (self.max_latency is not None and elapsed >= self.max_latency):
+                break
+            frame = next_frame()
+        with self._stats_lock:
+            self.stats["items"] += 1
+            self.stats["frames"] += n
+            self.stats["early_exits"] += early and n < self.max_frames
+        return Decision(int(probs.argmax()), confidence, n, elapsed, probs)
+
+    def frames_per_item(self) -> float:
+        with self._stats_lock:
+            return self.stats["frames"] / max(self.stats["items"], 1)
+
+
+def add_vote_args(parser) -> None:
+    group = parser.add_argument_group("multi-frame decision")
+    group.add_argument("--burst", type=int, default=5, help="max frames per item (1 = single frame)")
+    group.add_argument("--min-frames", type=int, default=1, help="frames taken before an early exit")
+    group.add_argument("--confidence-threshold", type=float, default=0.85,
+                       help="aggregate confidence that ends the burst early")
+    group.add_argument("--vote", choices=VOTE_MODES, default="logit", help="aggregation of the burst")
+    group.add_argument("--max-decision-latency", type=float, help="seconds before deciding anyway")
+
+
+def voter_from_args(args) -> BurstVoter:
+    return BurstVoter(max_frames=args.burst, min_frames=args.min_frames,
+                      threshold=args.confidence_threshold, mode=args.vote,
+                      max_latency=args.max_decision_latency)
@@ -34,7 +34,7 @@ def main():
     while True:
         key = readchar.readkey()
         if key == "s":
-            bin.close_all()
+            bin.close_all().join()
             break
 
 
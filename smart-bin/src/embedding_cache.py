@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour shortcut for items the bin has seen many times.
+
+Only the item is fingerprinted, not the tray: the frame is compared with
+the empty-tray thumbnail kept by trigger.PresenceTrigger and cropped to the
+bounding box of the pixels that differ from it. Frames without a
+background or without a clear foreground bypass the cache. The crop is
+reduced to a cheap fingerprint: a 12×12 grid of per-channel block means,
+with the mean removed and scaled to unit length, so it is insensitive to
+uniform brightness changes and compares by cosine similarity.
+Fingerprints of recent confident classifications are kept with their
+class probabilities in a fixed-size index (two preallocated arrays plus a
+last-used counter per slot; the least recently used slot is overwritten
+when full). A frame whose fingerprint is close enough to an entry reuses
+that entry's probabilities and skips the model. When an operator
+overrides a cached answer, evict() drops the matching entries.
+
+The index can be saved and restored across restarts; it is discarded when
+the model file changed. Hit rate and the inference time saved (hits times
+the average miss latency, minus the lookup cost) are reported.
+"""
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+CACHE_PATH = Path("data/embedding_cache.npz")
+GRID = 12
+# gray-level difference from the empty tray that counts as item
+FOREGROUND_THRESHOLD = 10.0
+
+
+def fingerprint(frame: np.ndarray, grid: int = GRID) -> np.ndarray:
+    h, w = frame.shape[0] // grid * grid, frame.shape[1] // grid * grid
+    blocks = frame[:h, :w].reshape(grid, h // grid, grid, w // grid, -1)
+    blocks = blocks.mean(axis=(1, 3), dtype=np.float32)
+    v = blocks.ravel()
+    v -= v.mean()
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 1e-6 else v
+
+
+def foreground(frame: np.ndarray, background: np.ndarray, threshold: float = FOREGROUND_THRESHOLD):
+    """
+    Crop of `frame` around the pixels that differ from `background`, a
+    strided grayscale thumbnail of the empty tray (PresenceTrigger.background).
+    None when nothing differs or the thumbnail does not match the frame.
+    """
+    stride = max(1, int(round(frame.shape[0] / background.shape[0])))
+    thumb = frame[::stride, ::stride]
+    thumb = thumb.mean(axis=2, dtype=np.float32) if thumb.ndim == 3 else thumb.astype(np.float32)
+    if thumb.shape != background.shape:
+        return None
+    mask = np.abs(thumb - background) > threshold
+    if not mask.any():
+        return None
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    return frame[rows[0] * stride:(rows[-1] + 1) * stride, cols[0] * stride:(cols[-1] + 1) * stride]
+
+
+def model_id(path) -> str:
+    """
+    Identifies a model file by name, size and modification time.
+    """
+    st = Path(path).stat()
+    return f"{Path(path).name}:{st.st_size}:{int(st.st_mtime)}"
+
+
+class EmbeddingCache:
+    def __init__(self, capacity: int = 512, threshold: float = 0.98, min_confidence: float = 0.9,
+                 grid: int = GRID):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self.grid = grid
+        self.vectors = None
+        self.probs = None
+        self.last_used = np.zeros(capacity, np.int64)
+        self.size = 0
+        self.tick = 0
+        self.path = None
+        self.model = None
+        self.stats = {"lookups": 0, "hits": 0, "inserts": 0, "evictions": 0,
+                      "bypassed": 0, "forgotten": 0}
+        self.miss_latency = None    # moving averages, seconds
+        self.hit_latency = None
+        self._lock = threading.Lock()
+
+    def _allocate(self, dim, classes):
+        self.vectors = np.zeros((self.capacity, dim), np.float32)
+        self.probs = np.zeros((self.capacity, classes), np.float32)
+
+    def lookup(self, vec: np.ndarray):
+        """
+        Probabilities of the closest entry if it is within the threshold, else None.
+        """
+        self.stats["lookups"] += 1
+        if not self.size:
+            return None
+        sims = self.vectors[:self.size] @ vec
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        self.tick += 1
+        self.last_used[best] = self.tick
+        self.stats["hits"] += 1
+        return self.probs[best].copy()
+
+    def insert(self, vec: np.ndarray, probs: np.ndarray) -> None:
+        if self.vectors is None:
+            self._allocate(vec.size, probs.size)
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = int(np.argmin(self.last_used))
+            self.stats["evictions"] += 1
+        self.tick += 1
+        self.vectors[slot] = vec
+        self.probs[slot] = probs
+        self.last_used[slot] = self.tick
+        self.stats["inserts"] += 1
+
+    def _vector(self, frame, background):
+        """
+        Fingerprint of the item in `frame`, or None when it cannot be isolated.
+        """
+        if background is None:
+            return None
+        region = foreground(frame, background)
+        if region is None or min(region.shape[:2]) < self.grid:
+            return None
+        return fingerprint(region, self.grid)
+
+    def evict(self, frame: np.ndarray, background) -> int:
+        """
+        Drops every entry matching `frame`, e.g. after an operator corrected
+        the answer served for it. Returns the number of entries dropped.
+        """
+        vec = self._vector(frame, background)
+        if vec is None:
+            return 0
+        with self._lock:
+            if not self.size:
+                return 0
+            keep = self.vectors[:self.size] @ vec < self.threshold
+            dropped = self.size - int(keep.sum())
+            if dropped:
+                n = self.size - dropped
+                self.vectors[:n] = self.vectors[:self.size][keep]
+                self.probs[:n] = self.probs[:self.size][keep]
+                self.last_used[:n] = self.last_used[:self.size][keep]
+                self.last_used[n:] = 0
+                self.size = n
+                self.stats["forgotten"] += dropped
+        return dropped
+
+    @staticmethod
+    def _average(old, new, alpha=0.1):
+        return new if old is None else old + alpha * (new - old)
+
+    def scores(self, frame: np.ndarray, compute, background=None) -> np.ndarray:
+        """
+        Cached probabilities for `frame`, or compute(frame), remembered
+        when it is confident enough. `background` is the empty-tray
+        thumbnail; without it the cache is bypassed.
+        """
+        start = time.perf_counter()
+        vec = self._vector(frame, background)
+        if vec is None:
+            self.stats["bypassed"] += 1
+            return compute(frame)
+        with self._lock:
+            probs = self.lookup(vec)
+        if probs is not None:
+            self.hit_latency = self._average(self.hit_latency, time.perf_counter() - start)
+            return probs
+        probs = np.asarray(compute(frame), np.float32)
+        self.miss_latency = self._average(self.miss_latency, time.perf_counter() - start)
+        if float(probs.max()) >= self.min_confidence:
+            with self._lock:
+                self.insert(vec, probs)
+        return probs
+
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / max(self.stats["lookups"], 1)
+
+    def saved_seconds(self) -> float:
+        if self.miss_latency is None or self.hit_latency is None:
+            return 0.0
+        return self.stats["hits"] * max(self.miss_latency - self.hit_latency, 0.0)
+
+    def report(self) -> str:
+        return (f"{self.stats['hits']}/{self.stats['lookups']} hits ({self.hit_rate():.0%}), "
+                f"{self.size} entries, {self.stats['forgotten']} evicted by operators, "
+                f"saved {self.saved_seconds():.1f}s of inference")
+
+    # ---- persistence ----
+
+    def open(self, path, model: str) -> bool:
+        """
+        Restores the index saved at `path` if it was built with `model`;
+        save() writes back to the same path.
+        """
+        self.path, self.model = Path(path), model
+        if not self.path.exists():
+            return False
+        with np.load(self.path) as data:
+            if (str(data["model"]) != model or int(data["grid"]) != self.grid
+                    or "foreground" not in data.files):
+                print(f"[Info] embedding cache {self.path} was built for another model or "
+                      "fingerprint, starting empty")
+                return False
+            vectors, probs, last_used = data["vectors"], data["probs"], data["last_used"]
+        # keep the most recently used entries if the capacity shrank
+        keep = np.argsort(-last_used)[:self.capacity]
+        self._allocate(vectors.shape[1], probs.shape[1])
+        self.size = len(keep)
+        self.vectors[:self.size] = vectors[keep]
+        self.probs[:self.size] = probs[keep]
+        self.last_used[:self.size] = last_used[keep]
+        self.tick = int(last_used.max()) if len(last_used) else 0
+        print(f"[Info] embedding cache: restored {self.size} entries from {self.path}")
+        return True
+
+    def save(self) -> None:
+        if self.path is None or not self.size:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.stem + ".tmp.npz")
+        np.savez(tmp, vectors=self.vectors[:self.size], probs=self.probs[:self.size],
+                 last_used=self.last_used[:self.size], model=np.array(self.model), grid=self.grid,
+                 foreground=True)
+        tmp.replace(self.path)
+
+
+def add_cache_args(parser) -> None:
+    group = parser.add_argument_group("embedding cache")
+    group.add_argument("--cache", action="store_true",
+                       help="reuse the result of a near-identical recent item instead of "
+                            "running the model")
+    group.add_argument("--cache-size", type=int, default=512,
+                       help="entries kept (least recently used evicted)")
+    group.add_argument("--cache-threshold", type=float, default=0.98,
+                       help="cosine similarity of fingerprints that counts as the same item")
+    group.add_argument("--cache-min-confidence", type=float, default=0.9,
+                       help="only remember classifications at least this confident")
+    group.add_argument("--cache-path", default=str(CACHE_PATH),
+                       help="where the index is saved between runs")
+
+
+def cache_from_args(args):
+    if not args.cache:
+        return None
+    return EmbeddingCache(args.cache_size, args.cache_threshold, args.cache_min_confidence)
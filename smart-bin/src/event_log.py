@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Local event log of routed items.
+
+Every routed item (class, confidence, decision latency, compartment, fill
+distance) is appended to a SQLite database in WAL mode. log() only queues
+the event; a writer thread inserts queued events in one transaction per
+batch (every `batch_size` events or `flush_interval` seconds), so the SD card
+sees one WAL append per batch instead of one synchronous write per item.
+With synchronous=NORMAL, WAL keeps the database consistent across power
+loss; at most the last unflushed batch is lost.
+
+Hourly per-class rollups are updated in the same transaction, so per-day and
+per-class queries read a few rollup rows instead of scanning the history.
+Run: python src/event_log.py [--db data/events.db] [--days 7]
+"""
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+EVENT_LOG_PATH = Path("data/events.db")
+BUCKET = 3600  # rollup granularity in seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,
+    cls INTEGER NOT NULL,
+    confidence REAL,
+    latency_ms REAL,
+    compartment INTEGER,
+    distance_cm REAL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS rollup (
+    bucket INTEGER NOT NULL,
+    cls INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    latency_ms_sum REAL NOT NULL,
+    PRIMARY KEY (bucket, cls)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO rollup (bucket, cls, count, confidence_sum, latency_ms_sum) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (bucket, cls) DO UPDATE SET
+    count = count + excluded.count,
+    confidence_sum = confidence_sum + excluded.confidence_sum,
+    latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum
+"""
+
+
+def connect(path) -> sqlite3.Connection:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class EventLog:
+    def __init__(self, path=EVENT_LOG_PATH, batch_size: int = 64, flush_interval: float = 5.0):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = connect(self.path)
+        self.written = 0
+        self._db_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def log(self, cls_id: int, confidence: float, latency: float = None, compartment: int = None,
+            distance: float = None, source: str = "model", ts: float = None) -> None:
+        """
+        Queues one routed item; never blocks on the disk. `latency` in seconds.
+        """
+        self._queue.put((ts or time.time(), int(cls_id), float(confidence),
+                         None if latency is None else latency * 1e3,
+                         compartment, distance, source))
+
+    def _write(self, rows) -> None:
+        rollup = {}
+        for ts, cls, confidence, latency_ms, *_ in rows:
+            key = (int(ts // BUCKET) * BUCKET, cls)
+            n, c, l = rollup.get(key, (0, 0.0, 0.0))
+            rollup[key] = (n + 1, c + confidence, l + (latency_ms or 0.0))
+        with self._db_lock, self.conn:
+            self.conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.executemany(ROLLUP_UPSERT, [k + v for k, v in rollup.items()])
+        self.written += len(rows)
+
+    def _drain(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.flush_interval
+        pending = []
+        while not self._stop.is_set():
+            try:
+                row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if row is not None:
+                    pending.append(row)
+            except queue.Empty:
+                pass
+            if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                pending += self._drain()
+                if pending:
+                    self._write(pending)
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+        pending += self._drain()
+        while pending:
+            self._write(pending)
+            pending = self._drain()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._queue.put(None)  # wakes the writer
+        self._thread.join()
+        with self._db_lock:
+            self.conn.close()
+
+    # ---- queries (rollup table only) ----
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def per_day(self, days: int = 7):
+        """
+        [(date, count)] for the last `days` days, local time.
+        """
+        since = time.time() - days * 86400
+        return self._query("SELECT date(bucket, 'unixepoch', 'localtime') AS day, SUM(count) FROM rollup "
+                           "WHERE bucket >= ? GROUP BY day ORDER BY day", (since - since % BUCKET,))
+
+    def per_class(self, since: float = None, until: float = None):
+        """
+        [(cls, count, mean confidence, mean latency ms)] between two timestamps.
+        """
+        lo = 0 if since is None else since - since % BUCKET
+        hi = float("inf") if until is None else until
+        return self._query("SELECT cls, SUM(count), SUM(confidence_sum) / SUM(count), "
+                           "SUM(latency_ms_sum) / SUM(count) FROM rollup "
+                           "WHERE bucket >= ? AND bucket < ? GROUP BY cls ORDER BY cls", (lo, hi))
+
+    def per_day_class(self, days: int = 7):
+        """
+        [(date, cls, count)] for the last `days` days.
+        """
+        since = time.time() - days * 86400
+        return self._query("SELECT date(bucket, 'unixepoch', 'localtime') AS day, cls, SUM(count) FROM rollup "
+                           "WHERE bucket >= ? GROUP BY day, cls ORDER BY day, cls", (since - since % BUCKET,))
+
+    def recent(self, n: int = 20):
+        return self._query("SELECT * FROM events ORDER BY ts DESC LIMIT ?", (n,))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=str(EVENT_LOG_PATH))
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--labels", default="data/labels.txt")
+    args = parser.parse_args()
+    labels = Path(args.labels).read_text().splitlines() if Path(args.labels).exists() else []
+    name = lambda cls: labels[cls] if cls < len(labels) else str(cls)
+
+    log = EventLog(args.db)
+    try:
+        print(f"Items per day (last {args.days} days):")
+        for day, count in log.per_day(args.days):
+            print(f"  {day}  {count}")
+        print("Items per class:")
+        for cls, count, confidence, latency in log.per_class(time.time() - args.days * 86400):
+            print(f"  {name(cls):<12} {count:>6}  conf {confidence:.2f}  latency {latency:.0f} ms")
+    finally:
+        log.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,9 @@
 """
 Load the existing trained Keras model and export it as a TensorFlow SavedModel
 and a TFLite flatbuffer, without retraining.
-Run: python src/export_model.py
+Run: python src/export_model.py [--model models/checkpoints/finetune-best.keras]
 """
+import argparse
 import tensorflow as tf
 from pathlib import Path
 
@@ -12,15 +13,28 @@ KERAS_MODEL = Path("models/model.keras")
 SAVED_MODEL_DIR = Path("models/saved_model")
 TFLITE_OUT = Path("models/model.tflite")
 
-print(f"Loading Keras model from {KERAS_MODEL} ...")
-model = tf.keras.models.load_model(KERAS_MODEL, compile=False)
 
-print(f"Exporting TensorFlow SavedModel to {SAVED_MODEL_DIR} ...")
-# Keras 3 uses model.export() to create a SavedModel
-model.export(str(SAVED_MODEL_DIR))
+def export(keras_model=KERAS_MODEL, saved_model_dir=SAVED_MODEL_DIR, tflite_out=TFLITE_OUT, model=None):
+    """
+    Export `model` (or the Keras file at `keras_model`) as SavedModel + TFLite.
+    """
+    if model is None:
+        print(f"Loading Keras model from {keras_model} ...")
+        model = tf.keras.models.load_model(keras_model, compile=False)
 
-print(f"Converting SavedModel at {SAVED_MODEL_DIR} to TFLite flatbuffer ...")
-converter = tf.lite.TFLiteConverter.from_saved_model(str(SAVED_MODEL_DIR))
-tflite_model = converter.convert()
-TFLITE_OUT.write_bytes(tflite_model)
-print(f"✓ TFLite model saved to {TFLITE_OUT} ({TFLITE_OUT.stat().st_size/1e6:.1f} MB)")
+    print(f"Exporting TensorFlow SavedModel to {saved_model_dir} ...")
+    # Keras 3 uses model.export() to create a SavedModel
+    model.export(str(saved_model_dir))
+
+    print(f"Converting SavedModel at {saved_model_dir} to TFLite flatbuffer ...")
+    converter = tf.lite.TFLiteConverter.from_saved_model(str(saved_model_dir))
+    tflite_model = converter.convert()
+    Path(tflite_out).write_bytes(tflite_model)
+    print(f"✓ TFLite model saved to {tflite_out} ({Path(tflite_out).stat().st_size/1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=Path, default=KERAS_MODEL, help="Keras model or checkpoint to export")
+    args = parser.parse_args()
+    export(args.model)
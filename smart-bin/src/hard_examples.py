@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Hard-example mining for the active-learning loop.
+
+Frames the model was unsure about (confidence below a threshold) or that
+an operator routed differently from the prediction are saved as JPEGs
+together with the predicted class and, when known, the correct label. The
+sorting loop only enqueues the frame; encoding and disk writes happen on a
+background thread, and frames are dropped rather than waited for when the
+queue is full.
+
+Layout (read by prepare_data.iter_hard_examples):
+  data/raw/hard_examples/index.jsonl         one JSON record per frame
+  data/raw/hard_examples/images/<day>/*.jpg
+
+Records without a label (low confidence, no operator) can be labelled
+later by setting their "label" field in index.jsonl.
+"""
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+
+HARD_EXAMPLES_DIR = Path("data/raw/hard_examples")
+INDEX = "index.jsonl"
+
+
+class HardExampleStore:
+    def __init__(self, directory=HARD_EXAMPLES_DIR, threshold: float = 0.6, jpeg_quality: int = 90,
+                 max_pending: int = 32):
+        self.dir = Path(directory)
+        self.threshold = threshold
+        self.jpeg_quality = jpeg_quality
+        self.stats = {"saved": 0, "dropped": 0, "low_confidence": 0, "override": 0}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="hard-examples", daemon=True)
+        self._thread.start()
+
+    def capture(self, frame, predicted: int, predicted_label: str, confidence: float,
+                label: str = None, overridden: bool = False) -> bool:
+        """
+        Queues `frame` if it is a hard example; returns True when queued.
+        `label` is the correct class name when an operator provided one.
+        """
+        if overridden:
+            reason = "override"
+        elif confidence < self.threshold:
+            reason = "low_confidence"
+        else:
+            return False
+        record = {"ts": time.time(), "reason": reason, "predicted": int(predicted),
+                  "predicted_label": predicted_label, "confidence": round(float(confidence), 4),
+                  "label": label}
+        try:
+            self._queue.put_nowait((frame, record))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats[reason] += 1
+        return True
+
+    def _save(self, frame, record) -> None:
+        import cv2
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return
+        day = time.strftime("%Y%m%d", time.localtime(record["ts"]))
+        rel = Path("images")/day/f"{int(record['ts'] * 1000)}_{self.stats['saved']}_{record['reason']}.jpg"
+        (self.dir/rel).parent.mkdir(parents=True, exist_ok=True)
+        (self.dir/rel).write_bytes(buf.tobytes())
+        with open(self.dir/INDEX, "a") as f:
+            f.write(json.dumps(dict(record, file=str(rel))) + "\n")
+        self.stats["saved"] += 1
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._save(*item)
+
+    def close(self) -> None:
+        """
+        Writes everything still queued, then stops the writer.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+def iter_index(directory=HARD_EXAMPLES_DIR):
+    """
+    Yields (image path, record) for every saved hard example.
+    """
+    index = Path(directory)/INDEX
+    if not index.exists():
+        return
+    with open(index) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                yield Path(directory)/record["file"], record
+
+
+def add_hard_example_args(parser) -> None:
+    group = parser.add_argument_group("hard examples")
+    group.add_argument("--hard-examples", default=str(HARD_EXAMPLES_DIR),
+                       help="where low-confidence and operator-corrected frames are saved ('' to disable)")
+    group.add_argument("--hard-threshold", type=float, default=0.6,
+                       help="save frames whose decision confidence is below this")
+
+
+def hard_examples_from_args(args):
+    if not args.hard_examples:
+        return None
+    return HardExampleStore(args.hard_examples, threshold=args.hard_threshold)
@@ -3,11 +3,16 @@
 Control servos for waste-bin lids using GPIOZero on a Raspberry Pi.
 Each class name in data/labels.txt is mapped to a GPIO pin.
 """
+import os
 try:
     from gpiozero import Servo
     HAS_GPIOZERO = True
 except ImportError:
     HAS_GPIOZERO = False
+if os.environ.get("SMARTBIN_SIM"):
+    # simulated servos with slew time, see smartbin/sim.py
+    from smartbin.sim import GpioServo as Servo
+    HAS_GPIOZERO = True
 import time
 
 # Map classification names to GPIO pins
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+On-disk outbox that ships telemetry and low-confidence frames to a collector.
+
+put_event() / put_frame() only enqueue in memory and never block the
+sorting loop. A writer thread appends records to an open segment file;
+when the segment reaches `segment_bytes` or `segment_age` seconds it is
+gzip-compressed and sealed as seg-<time>.gz. A sender thread uploads sealed
+segments oldest first, one POST per segment, over a single persistent HTTP
+connection, and deletes each one once the collector acknowledges it. On
+failure it backs off exponentially (with jitter) and reconnects. When the
+outbox directory exceeds its disk budget the oldest sealed segments are
+dropped. Segments survive restarts; a segment interrupted by a crash is
+sealed on the next start.
+
+A segment is a sequence of records: struct ">II" (meta length, payload
+length), UTF-8 JSON meta, raw payload (JPEG bytes for frames). The batch id
+sent with each upload is the segment name, so a re-sent batch can be
+recognised by the collector (see collector.py).
+"""
+import gzip
+import http.client
+import json
+import os
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+OUTBOX_DIR = Path("data/outbox")
+HEADER = struct.Struct(">II")
+PART = "current.part"
+
+
+def pack_record(meta: dict, payload: bytes = b"") -> bytes:
+    meta = json.dumps(meta, separators=(",", ":")).encode()
+    return HEADER.pack(len(meta), len(payload)) + meta + payload
+
+
+def iter_records(data: bytes):
+    """
+    Yields (meta, payload) pairs; a truncated trailing record is ignored.
+    """
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        meta_len, payload_len = HEADER.unpack_from(data, pos)
+        end = pos + HEADER.size + meta_len + payload_len
+        if end > len(data):
+            return
+        meta = json.loads(data[pos + HEADER.size:pos + HEADER.size + meta_len])
+        yield meta, data[pos + HEADER.size + meta_len:end]
+        pos = end
+
+
+class Outbox:
+    def __init__(self, directory=OUTBOX_DIR, url=None, budget_bytes=200 * 1024 * 1024,
+                 segment_bytes=1024 * 1024, segment_age=60.0, retry_min=2.0, retry_max=300.0,
+                 bin_id=None, jpeg_quality=85, max_pending=256):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.url = url
+        self.budget_bytes = budget_bytes
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.bin_id = bin_id or socket.gethostname()
+        self.jpeg_quality = jpeg_quality
+        self.stats = {"queued": 0, "dropped_full": 0, "segments": 0, "uploaded": 0,
+                      "upload_bytes": 0, "failures": 0, "dropped_budget": 0}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._sealed = threading.Event()
+        self._conn = None
+        self._part = None
+        self._part_started = None
+
+        if (self.dir/PART).exists():
+            self._seal()
+        self._threads = [threading.Thread(target=self._write_loop, name="outbox-writer", daemon=True)]
+        if url:
+            self._threads.append(threading.Thread(target=self._send_loop, name="outbox-sender", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    # ---- producer side (sorting loop) ----
+
+    def _put(self, item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.stats["dropped_full"] += 1
+            return False
+        self.stats["queued"] += 1
+        return True
+
+    def put_event(self, event: dict) -> bool:
+        return self._put(("event", dict(event, ts=event.get("ts", time.time())), None))
+
+    def put_frame(self, frame, meta: dict) -> bool:
+        """
+        Queues a frame (HxWx3 uint8); JPEG encoding happens on the writer thread.
+        """
+        return self._put(("frame", dict(meta, ts=meta.get("ts", time.time())), frame))
+
+    # ---- writer ----
+
+    def _encode(self, frame) -> bytes:
+        import cv2
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buf.tobytes() if ok else b""
+
+    def _append(self, kind, meta, frame) -> None:
+        payload = self._encode(frame) if kind == "frame" else b""
+        if self._part is None:
+            self._part = open(self.dir/PART, "ab")
+            self._part_started = time.monotonic()
+        self._part.write(pack_record(dict(meta, kind=kind, bin=self.bin_id), payload))
+
+    def _seal(self) -> None:
+        """
+        Compresses the open segment into seg-<time>.gz and enforces the budget.
+        """
+        if self._part is not None:
+            self._part.close()
+            self._part = None
+        part = self.dir/PART
+        data = part.read_bytes() if part.exists() else b""
+        if data:
+            name = "seg-%d.gz" % time.time_ns()
+            tmp = self.dir/(name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(data, compresslevel=6))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.dir/name)
+            self.stats["segments"] += 1
+        if part.exists():
+            part.unlink()
+        self._enforce_budget()
+        self._sealed.set()
+
+    def sealed_segments(self):
+        return sorted(self.dir.glob("seg-*.gz"))
+
+    def _enforce_budget(self) -> None:
+        segments = self.sealed_segments()
+        total = sum(p.stat().st_size for p in segments)
+        while segments and total > self.budget_bytes:
+            oldest = segments.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink()
+            self.stats["dropped_budget"] += 1
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                self._append(*item)
+            if self._part is not None:
+                self._part.flush()
+                if (self._part.tell() >= self.segment_bytes
+                        or time.monotonic() - self._part_started >= self.segment_age):
+                    self._seal()
+            if self._stop.is_set() and self._queue.empty():
+                self._seal()
+                return
+
+    # ---- sender ----
+
+    def _connection(self):
+        if self._conn is None:
+            parts = urlsplit(self.url)
+            cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(parts.hostname, parts.port, timeout=30)
+        return self._conn
+
+    def _upload(self, segment: Path) -> None:
+        body = segment.read_bytes()
+        path = urlsplit(self.url).path or "/ingest"
+        conn = self._connection()
+        try:
+            conn.request("POST", path, body=body, headers={
+                "Content-Type": "application/x-smartbin-records",
+                "Content-Encoding": "gzip",
+                "X-Bin-Id": self.bin_id,
+                "X-Batch-Id": segment.stem,
+            })
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._conn = None
+            raise
+        if response.status // 100 != 2:
+            raise IOError(f"collector answered {response.status} {response.reason}")
+        self.stats["upload_bytes"] += len(body)
+
+    def _send_loop(self) -> None:
+        delay = self.retry_min
+        while not self._stop.is_set():
+            segments = self.sealed_segments()
+            if not segments:
+                self._sealed.wait(timeout=self.segment_age)
+                self._sealed.clear()
+                continue
+            try:
+                self._upload(segments[0])
+            except (OSError, http.client.HTTPException) as e:
+                self.stats["failures"] += 1
+                print(f"[Warning] outbox upload failed, retrying in {delay:.1f}s: {e}")
+                self._stop.wait(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, self.retry_max)
+                continue
+            delay = self.retry_min
+            segments[0].unlink(missing_ok=True)
+            self.stats["uploaded"] += 1
+        if self._conn is not None:
+            self._conn.close()
+
+    def close(self) -> None:
+        """
+        Seals what was queued; unsent segments stay on disk for the next start.
+        """
+        self._stop.set()
+        self._sealed.set()
+        for t in self._threads:
+            t.join()
+
+
+def add_outbox_args(parser) -> None:
+    group = parser.add_argument_group("fleet sync")
+    group.add_argument("--collector", metavar="URL", help="upload telemetry to this collector, e.g. "
+                       "http://host:8765/ingest")
+    group.add_argument("--outbox", default=str(OUTBOX_DIR), help="directory of queued uploads")
+    group.add_argument("--outbox-budget", type=float, default=200, metavar="MB",
+                       help="disk space the outbox may use before dropping the oldest batches")
+    group.add_argument("--upload-interval", type=float, default=60.0,
+                       help="seconds a batch collects records before it is sealed and sent")
+    group.add_argument("--upload-frames-below", type=float, default=0.6, metavar="CONF",
+                       help="also upload the frame when the decision confidence is below CONF")
+
+
+def outbox_from_args(args):
+    if not args.collector:
+        return None
+    return Outbox(args.outbox, args.collector, budget_bytes=int(args.outbox_budget * 1024 * 1024),
+                  segment_age=args.upload_interval)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Pipelined capture -> inference -> actuation runtime for the smart bin.
+
+Each stage runs in its own thread and hands work to the next one through a
+bounded queue, so the camera and the TFLite interpreter keep working on the
+next item while the flaps are still dropping the previous one. A full
+downstream queue blocks the stage feeding it (backpressure); the capture
+queue can instead keep only the newest frames so inference never works on
+stale images.
+"""
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when the pipeline stops while it waits for input."""
+
+
+class Pipeline:
+    """
+    capture():              returns a frame (numpy array).
+    infer(frame):           returns a result, e.g. (cls_id, confidence).
+                            Returning None drops the frame.
+    actuate(frame, result): moves the hardware. Returning False stops the pipeline.
+
+    infer_workers > 1 runs several inference threads, for use with a
+    backend.BackendPool.
+
+    Every captured frame that infer() does not drop is actuated, so capture()
+    should only return frames that show a new item (see trigger.PresenceTrigger).
+    """
+
+    def __init__(self, capture, infer, actuate, depth: int = 2, drop_stale: bool = True,
+                 infer_workers: int = 1):
+        self.capture = capture
+        self.infer = infer
+        self.actuate = actuate
+        self.drop_stale = drop_stale
+        self.frames = queue.Queue(maxsize=depth)
+        self.results = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.error = None
+        self.counts = {"captured": 0, "dropped": 0, "inferred": 0, "actuated": 0}
+        self._counts_lock = threading.Lock()
+        self._started = None
+        self._threads = [
+            threading.Thread(target=self._guard, args=(self._capture_loop,), name="capture", daemon=True),
+            *(threading.Thread(target=self._guard, args=(self._infer_loop,), name=f"inference-{i}", daemon=True)
+              for i in range(max(1, infer_workers))),
+            threading.Thread(target=self._guard, args=(self._actuate_loop,), name="actuation", daemon=True),
+        ]
+
+    def _count(self, key):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    # ---------- stages ----------
+    def _capture_loop(self):
+        while not self.stopped.is_set():
+            frame = self.capture()
+            self._count("captured")
+            if self.drop_stale:
+                while True:
+                    try:
+                        self.frames.put_nowait(frame)
+                        break
+                    except queue.Full:
+                        try:
+                            self.frames.get_nowait()
+                            self._count("dropped")
+                        except queue.Empty:
+                            pass
+            else:
+                self._put(self.frames, frame)
+
+    def _infer_loop(self):
+        while True:
+            frame = self._get(self.frames)
+            if frame is _STOP:
+                return
+            try:
+                result = self.infer(frame)
+            except PipelineStopped:
+                return
+            self._count("inferred")
+            if result is not None:
+                self._put(self.results, (frame, result))
+
+    def _actuate_loop(self):
+        while True:
+            item = self._get(self.results)
+            if item is _STOP:
+                return
+            keep_going = self.actuate(*item)
+            self._count("actuated")
+            if keep_going is False:
+                self.stop()
+                return
+
+    def next_frame(self):
+        """
+        Takes another frame off the capture queue, for infer() callables that
+        classify a burst of frames per item (see decision.BurstVoter).
+        """
+        frame = self._get(self.frames)
+        if frame is _STOP:
+            raise PipelineStopped()
+        return frame
+
+    # ---------- plumbing ----------
+    def _put(self, q, item):
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        while not self.stopped.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _guard(self, loop):
+        try:
+            loop()
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            self.stop()
+
+    # ---------- control ----------
+    def start(self):
+        self._started = time.monotonic()
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        """
+        Waits until the pipeline stops; re-raises the first stage error.
+        Returns False if `timeout` expired first.
+        """
+        try:
+            if not self.stopped.wait(timeout):
+                return False
+        except KeyboardInterrupt:
+            self.stop()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(1.0)
+        if self.error is not None:
+            raise PipelineError("pipeline stage failed") from self.error
+        return True
+
+    def run(self):
+        self.start()
+        self.join()
+
+    def items_per_min(self) -> float:
+        if self._started is None:
+            return 0.0
+        elapsed = time.monotonic() - self._started
+        return 60.0 * self.counts["actuated"] / elapsed if elapsed > 0 else 0.0
@@ -1,13 +1,32 @@
 #!/usr/bin/env python
 """
 Creates data/images/<class>/*.jpg @224×224 for 4 target classes.
-Run:  python src/prepare_data.py
+
+Images are decoded, resized and re-encoded in a process pool. A manifest of
+processed inputs (data/images/manifest.json) makes reruns incremental: only
+new or changed source files are processed and outputs of removed sources
+are deleted. Use --clean to rebuild from scratch.
+
+Every output is hashed (exact pixel content, or a 64-bit difference hash with
+--dedup perceptual) and duplicates across TrashNet/TACO/extras are dropped.
+Perceptual hashes within --dedup-distance bits (Hamming) count as duplicates;
+every dropped output and the one kept in its place are listed in
+data/images/duplicates.csv.
+Labelled hard examples captured on the bins (data/raw/hard_examples, see
+hard_examples.py) are ingested as a fourth source next to TrashNet, TACO
+and the extras. --format shards additionally packs the deduplicated set into memory-mappable
+shards under data/shards/ (see shards.py) that train_model.py can stream.
+Run:  python src/prepare_data.py [--workers N] [--clean] [--format shards]
 """
-import json, shutil, random, itertools, csv
+import json, shutil, random, itertools, csv, os, argparse, time, hashlib
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import cv2
 import numpy as np
 from tqdm import tqdm
+from shards import ShardWriter, SHARD_DIR, SHARD_SIZE
+from hard_examples import iter_index, HARD_EXAMPLES_DIR
 
 # -------- user‑config --------
 TARGET_SIZE = 224
@@ -19,6 +38,11 @@ CLASSES = {
 }
 RAW = Path("data/raw")
 OUT = Path("data/images")
+MANIFEST = OUT/"manifest.json"
+TACO_MARGIN = 0.1     # bbox crop margin, fraction of the box size on each side
+DEDUP = "content"     # "content", "perceptual" or "off"
+DEDUP_DISTANCE = 4    # max differing dHash bits for --dedup perceptual
+DUPLICATES = OUT/"duplicates.csv"
 # -----------------------------
 
 def resize_pad(img, size=224):
@@ -32,10 +56,147 @@ def resize_pad(img, size=224):
     canvas[top:top+h2, left:left+w2] = img
     return canvas
 
-def ensure_out():
-    if OUT.exists(): shutil.rmtree(OUT)
+def ensure_out(clean=False):
+    if clean and OUT.exists(): shutil.rmtree(OUT)
     for c in CLASSES: (OUT/c).mkdir(parents=True, exist_ok=True)
 
+def load_manifest():
+    try:
+        return json.loads(MANIFEST.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    # write-then-rename so an interrupted run never leaves a truncated manifest
+    tmp = MANIFEST.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest))
+    tmp.replace(MANIFEST)
+
+def signature(img_p, crops, margin, dedup):
+    st = img_p.stat()
+    spec = hashlib.md5(repr((sorted(crops, key=repr), margin, dedup)).encode()).hexdigest()
+    return f"{st.st_size}:{st.st_mtime_ns}:{spec}"
+
+def remove_outputs(outputs):
+    for rel in outputs:
+        (OUT/rel).unlink(missing_ok=True)
+
+def init_worker():
+    cv2.setNumThreads(1)   # parallelism comes from the pool
+
+def crop_bbox(img, bbox, margin):
+    """
+    Crop a COCO [x, y, w, h] box grown by `margin` × its size on each side,
+    clipped to the image.
+    """
+    x, y, w, h = bbox
+    H, W = img.shape[:2]
+    x0 = max(int(x - margin * w), 0)
+    y0 = max(int(y - margin * h), 0)
+    x1 = min(int(round(x + w + margin * w)), W)
+    y1 = min(int(round(y + h + margin * h)), H)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return img[y0:y1, x0:x1]
+
+def image_hash(img, dedup):
+    if dedup == "perceptual":
+        # dHash: 9×8 grayscale thumbnail, one bit per horizontal gradient sign
+        small = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+        return np.packbits(small[:, 1:] > small[:, :-1]).tobytes().hex()
+    if dedup == "content":
+        return hashlib.sha1(img.tobytes()).hexdigest()
+    return None
+
+class HashIndex:
+    """
+    Hashes of kept outputs. find() returns the output whose hash is within
+    `max_distance` bits of a 64-bit hex hash; with max_distance > 0 the hash
+    is split into max_distance + 1 bands, and two hashes that close must
+    agree exactly on at least one band (pigeonhole), so only candidates
+    sharing a band are compared.
+    """
+    def __init__(self, max_distance=0):
+        self.max_distance = max_distance
+        self.exact = {}
+        bands = max_distance + 1
+        self.bands = [(i * 64 // bands, (i + 1) * 64 // bands) for i in range(bands)]
+        self.buckets = [defaultdict(list) for _ in self.bands]
+
+    def _keys(self, value):
+        return [(value >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self.bands]
+
+    def find(self, h):
+        """(kept output, distance) of the closest match, or None."""
+        if h in self.exact:
+            return self.exact[h], 0
+        if not self.max_distance:
+            return None
+        value, best = int(h, 16), None
+        for bucket, key in zip(self.buckets, self._keys(value)):
+            for other, rel in bucket.get(key, ()):
+                d = bin(value ^ other).count("1")
+                if d <= self.max_distance and (best is None or d < best[1]):
+                    best = (rel, d)
+        return best
+
+    def add(self, h, rel):
+        if h in self.exact:
+            return
+        self.exact[h] = rel
+        if self.max_distance:
+            value = int(h, 16)
+            for bucket, key in zip(self.buckets, self._keys(value)):
+                bucket[key].append((value, rel))
+
+def process_image(job):
+    """
+    Decode one source image once, then resize → hash → encode every crop of it.
+    `crops` holds (class, bbox or None for the whole image, name suffix).
+    Returns (source, outputs, hashes, (decode_s, resize_s, encode_s)).
+    """
+    img_p, crops, margin, dedup = job
+    t0 = time.perf_counter()
+    img = cv2.imread(str(img_p))
+    t1 = time.perf_counter()
+    if img is None:
+        return str(img_p), [], [], (t1 - t0, 0.0, 0.0)
+    resize_s = encode_s = 0.0
+    outputs, hashes = [], []
+    stem = f"{img_p.stem}_{img_p.stat().st_ino}"
+    for cls, bbox, suffix in crops:
+        t2 = time.perf_counter()
+        region = img if bbox is None else crop_bbox(img, bbox, margin)
+        if region is None: continue
+        region = resize_pad(region, TARGET_SIZE)
+        t3 = time.perf_counter()
+        out_p = OUT/cls/f"{stem}{suffix}.jpg"
+        cv2.imwrite(str(out_p), region)
+        outputs.append(str(out_p.relative_to(OUT)))
+        hashes.append(image_hash(region, dedup))
+        resize_s += t3 - t2
+        encode_s += time.perf_counter() - t3
+    return str(img_p), outputs, hashes, (t1 - t0, resize_s, encode_s)
+
+def load_rgb(rel):
+    img = cv2.imread(str(OUT/rel))
+    return None if img is None else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def write_shards(manifest, workers=None, shard_size=SHARD_SIZE):
+    """
+    Pack every (deduplicated) output listed in the manifest into data/shards/.
+    """
+    classes = sorted(CLASSES)   # same label ids as image_dataset_from_directory
+    outputs = sorted(rel for entry in manifest.values() for rel in entry["outputs"])
+    writer = ShardWriter(SHARD_DIR, classes, TARGET_SIZE, shard_size)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        for rel, img in zip(outputs, tqdm(pool.map(load_rgb, outputs, chunksize=64), total=len(outputs))):
+            if img is None: continue
+            writer.add(img, classes.index(Path(rel).parts[0]))
+    index = writer.close()
+    print(f"Packed {sum(s['count'] for s in index['shards'])} images into "
+          f"{len(index['shards'])} shards under {SHARD_DIR}")
+
 def iter_trashnet():
     """
     Yield (filepath, label) pairs no matter how TrashNet is nested.
@@ -65,11 +226,32 @@ def iter_trashnet():
 
 
 def iter_taco():
-    taco_json = json.load(open(RAW/"taco"/"data"/"annotations.json"))
+    """
+    Yield (filepath, label, (bbox, suffix)) for every TACO annotation.
+
+    Categories and images are looked up by id (not list position), and the
+    annotations are grouped per image so consecutive items share a file and
+    process_image decodes each photo only once.
+    """
+    ann_file = RAW/"taco"/"data"/"annotations.json"
+    if not ann_file.exists():
+        return
+    taco_json = json.load(open(ann_file))
+    categories = {c["id"]: c["name"].lower() for c in taco_json["categories"]}
+    images = {im["id"]: im for im in taco_json["images"]}
+    per_image = defaultdict(list)
     for ann in taco_json["annotations"]:
-        cat_name = taco_json["categories"][ann["category_id"]]["name"].lower()
-        img_file = RAW/"taco"/"data"/"images"/taco_json["images"][ann["image_id"]]["file_name"]
-        yield img_file, cat_name
+        per_image[ann["image_id"]].append(ann)
+
+    for image_id, anns in per_image.items():
+        image = images.get(image_id)
+        if image is None: continue
+        img_file = RAW/"taco"/"data"/"images"/image["file_name"]
+        for ann in anns:
+            cat_name = categories.get(ann["category_id"])
+            if cat_name is None or not ann.get("bbox"): continue
+            yield img_file, cat_name, (tuple(ann["bbox"]), f"_{ann['id']}")
+
 def iter_extra():
     """
     Yield (filepath, label) for all images under data/raw/compost and data/raw/electronics
@@ -82,24 +264,129 @@ def iter_extra():
             yield img_p, cls
 
 
-def main():
-    ensure_out()
+def iter_hard_examples():
+    """
+    Yield (filepath, label) for labelled hard examples captured on the bins
+    (low-confidence or operator-corrected frames, see hard_examples.py).
+    """
+    unlabelled = 0
+    for img_p, record in iter_index(HARD_EXAMPLES_DIR):
+        if not record.get("label"):
+            unlabelled += 1
+            continue
+        if img_p.exists():
+            yield img_p, record["label"].lower()
+    if unlabelled:
+        print(f"[Info] {unlabelled} hard examples still need a label in {HARD_EXAMPLES_DIR/'index.jsonl'}")
+
+
+def collect_jobs():
+    """
+    Group all sources by image path → set of (class, bbox, suffix) crops.
+    Whole-image sources use bbox None.
+    """
     m = {alias: cls for cls, aliases in CLASSES.items() for alias in aliases}
-    for img_p, old_label in itertools.chain(
+    # target class names label themselves (extras, hard examples)
+    m.update({cls: cls for cls in CLASSES})
+    jobs = defaultdict(set)
+    for img_p, old_label, *crop in itertools.chain(
         iter_trashnet(),
         iter_taco(),
-        iter_extra()
+        iter_extra(),
+        iter_hard_examples()
     ):
 
         cls = m.get(old_label)
         if not cls: continue
-        img = cv2.imread(str(img_p))
-        if img is None: continue
-        out_p = OUT/cls/f"{img_p.stem}_{img_p.stat().st_ino}.jpg"
-        cv2.imwrite(str(out_p), resize_pad(img, TARGET_SIZE))
+        bbox, suffix = crop[0] if crop else (None, "")
+        jobs[img_p].add((cls, bbox, suffix))
+    return jobs
+
+
+def main(workers=None, clean=False, margin=TACO_MARGIN, dedup=DEDUP, fmt="jpg",
+         shard_size=SHARD_SIZE, dedup_distance=DEDUP_DISTANCE):
+    ensure_out(clean)
+    manifest = {} if clean else load_manifest()
+    jobs = collect_jobs()
+
+    # drop outputs of sources that disappeared or changed since the last run
+    todo, sigs = [], {}
+    current = {str(p) for p in jobs}
+    for src in list(manifest):
+        if src not in current:
+            remove_outputs(manifest.pop(src)["outputs"])
+    for img_p, crops in jobs.items():
+        sigs[str(img_p)] = sig = signature(img_p, crops, margin, dedup)
+        entry = manifest.get(str(img_p))
+        if entry and entry["sig"] == sig:
+            continue
+        if entry:
+            remove_outputs(manifest.pop(str(img_p))["outputs"])
+        todo.append((img_p, sorted(crops, key=repr), margin, dedup))
+    print(f"{len(jobs)} source images, {len(jobs) - len(todo)} up to date, {len(todo)} to process")
+
+    # hashes of outputs kept by earlier runs seed the duplicate check
+    seen = HashIndex(dedup_distance if dedup == "perceptual" else 0)
+    for entry in manifest.values():
+        for rel, h in zip(entry["outputs"], entry.get("hashes", [])):
+            if h: seen.add(h, rel)
+    report = open(DUPLICATES, "a", newline="")
+    report_csv = csv.writer(report)
+    if report.tell() == 0:
+        report_csv.writerow(["source", "dropped", "kept", "distance"])
+    stage = [0.0, 0.0, 0.0]
+    written = duplicates = 0
+    t_start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            results = pool.map(process_image, todo, chunksize=16)
+            for i, (src, outputs, hashes, times) in enumerate(tqdm(results, total=len(todo))):
+                kept, kept_hashes = [], []
+                for rel, h in zip(outputs, hashes):
+                    match = seen.find(h) if h is not None else None
+                    if match is not None and match[0] != rel:
+                        (OUT/rel).unlink(missing_ok=True)
+                        report_csv.writerow([src, rel, *match])
+                        duplicates += 1
+                        continue
+                    if h is not None: seen.add(h, rel)
+                    kept.append(rel)
+                    kept_hashes.append(h)
+                manifest[src] = {"sig": sigs[src], "outputs": kept, "hashes": kept_hashes}
+                written += len(kept)
+                for k in range(3): stage[k] += times[k]
+                if i % 500 == 499: save_manifest(manifest)
+    finally:
+        save_manifest(manifest)
+        report.close()
+
+    wall = time.perf_counter() - t_start
+    n = max(len(todo), 1)
+    print(f"{len(todo)} images → {written} outputs ({duplicates} duplicates dropped, see {DUPLICATES}) "
+          f"in {wall:.1f}s ({len(todo) / max(wall, 1e-9):.1f} img/s)")
+    for name, total in zip(("decode", "resize", "encode"), stage):
+        print(f"  {name:<7} {1e3 * total / n:7.2f} ms/img  ({n / max(total, 1e-9):.1f} img/s per worker)")
+    if fmt == "shards":
+        write_shards(manifest, workers, shard_size)
     # write labels.txt
     with open("data/labels.txt","w") as f: f.write("\n".join(CLASSES.keys()))
     print("Done — images prepared!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--clean", action="store_true",
+                        help="delete data/images and the manifest and rebuild everything")
+    parser.add_argument("--taco-margin", type=float, default=TACO_MARGIN,
+                        help="margin around TACO bounding boxes, as a fraction of the box size")
+    parser.add_argument("--dedup", choices=("content", "perceptual", "off"), default=DEDUP,
+                        help="drop duplicate images by exact pixel hash or perceptual hash")
+    parser.add_argument("--dedup-distance", type=int, default=DEDUP_DISTANCE,
+                        help="perceptual hashes differing in at most this many bits are duplicates")
+    parser.add_argument("--format", dest="fmt", choices=("jpg", "shards"), default="jpg",
+                        help="also pack the dataset into memory-mappable shards under data/shards")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="images per shard")
+    args = parser.parse_args()
+    main(workers=args.workers, clean=args.clean, margin=args.taco_margin, dedup=args.dedup,
+         fmt=args.fmt, shard_size=args.shard_size, dedup_distance=args.dedup_distance)
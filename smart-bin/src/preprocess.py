@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Writes camera frames straight into a TFLite interpreter's input tensor.
+
+Float models get the frame scaled to [-1, 1] with in-place ufuncs on the
+interpreter's own buffer. Quantized models (uint8/int8) get the same
+normalization folded into the input scale and zero-point, computed in a
+preallocated scratch buffer, or a plain copy when the quantization already
+matches raw pixels. No per-frame arrays are allocated on either path.
+"""
+import numpy as np
+
+
+class InputWriter:
+    def __init__(self, interpreter, input_detail: dict):
+        self.interpreter = interpreter
+        self.index = input_detail["index"]
+        self.dtype = np.dtype(input_detail["dtype"])
+        self.shape = tuple(input_detail["shape"][1:])
+        self.float_input = self.dtype.kind == "f"
+
+        scale, zero_point = input_detail.get("quantization", (0.0, 0))
+        # pixel -> pixel / 127.5 - 1 -> (real / scale) + zero_point, folded into one affine
+        self.raw = self.float_input or not scale or (
+            np.isclose(scale * 127.5, 1.0, rtol=1e-3) and zero_point == 128 and self.dtype == np.uint8
+        ) or (
+            np.isclose(scale * 127.5, 1.0, rtol=1e-3) and zero_point == 0 and self.dtype == np.int8
+        )
+        if self.float_input:
+            self.mul, self.add = 1.0 / 127.5, -1.0
+        elif scale:
+            self.mul = 1.0 / (127.5 * scale)
+            self.add = zero_point - 1.0 / scale
+        info = np.iinfo(self.dtype) if not self.float_input else None
+        self.lo, self.hi = (info.min, info.max) if info is not None else (None, None)
+        self.scratch = None if self.raw else np.empty(self.shape, np.float32)
+
+    def write(self, frame: np.ndarray) -> None:
+        """
+        Normalizes `frame` (HxWx3 uint8) into the input tensor. Must be called
+        before interpreter.invoke(); no reference to the tensor view is kept.
+        """
+        dst = self.interpreter.tensor(self.index)()[0]
+        self._fill(frame, dst)
+        del dst
+
+    def write_batch(self, frames) -> None:
+        """
+        Like write(), for an input tensor resized to batch len(frames).
+        """
+        dst = self.interpreter.tensor(self.index)()
+        for i, frame in enumerate(frames):
+            self._fill(frame, dst[i])
+        del dst
+
+    def _fill(self, frame: np.ndarray, dst: np.ndarray) -> None:
+        if frame.shape != self.shape:
+            raise ValueError(f"frame shape {frame.shape} does not match model input {self.shape}")
+        if self.float_input:
+            np.multiply(frame, self.mul, out=dst, casting="unsafe")
+            np.add(dst, self.add, out=dst)
+        elif self.raw:
+            if self.dtype == np.int8:
+                np.subtract(frame, 128, out=dst, casting="unsafe")
+            else:
+                np.copyto(dst, frame, casting="unsafe")
+        else:
+            buf = self.scratch
+            np.multiply(frame, self.mul, out=buf, casting="unsafe")
+            np.add(buf, self.add, out=buf)
+            np.rint(buf, out=buf)
+            np.clip(buf, self.lo, self.hi, out=buf)
+            np.copyto(dst, buf, casting="unsafe")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Post-training quantization of the exported SavedModel with an accuracy gate.
+
+Builds dynamic-range, float16 and full-integer (uint8 in/out) variants of
+models/saved_model, using a representative dataset sampled from the training
+split of data/images. Each variant is evaluated against the validation split
+next to the float32 baseline (models/model.tflite) and a size/latency/accuracy
+table is printed. Only variants whose accuracy drop stays within
+--max-drop are published to models/; the rest stay in models/candidates/.
+The split is read from the same source as the training run (recorded by
+train_model.py in models/data_split.json): data/images, or the record
+shards when training used --shards, which split per record.
+Run: python src/quantize_model.py [--shards data/shards]
+"""
+import argparse
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+from backend import TFLiteBackend
+from data_pipeline import make_dataset
+
+SAVED_MODEL_DIR = Path("models/saved_model")
+BASELINE = Path("models/model.tflite")
+CANDIDATES = Path("models/candidates")
+REPORT = Path("models/quantization_report.json")
+DATA_DIR = Path("data/images")
+SPLIT = Path("models/data_split.json")
+
+VARIANTS = {
+    "dynamic": "model_dynamic.tflite",
+    "f16": "model_f16.tflite",
+    "int8": "model_int8.tflite",
+}
+
+
+def split_source(shards=None):
+    """
+    (data_dir, shards_dir) of the training run: --shards if given, else
+    what train_model.py recorded, else data/images.
+    """
+    if shards:
+        return DATA_DIR, shards
+    try:
+        split = json.loads(SPLIT.read_text())
+    except (FileNotFoundError, ValueError):
+        print(f"[Warning] {SPLIT} not found, assuming training used {DATA_DIR}")
+        return DATA_DIR, None
+    return Path(split["data_dir"]), split.get("shards")
+
+
+def load_split(subset, source, batch=32):
+    # same split as train_model.py so validation images were never trained on
+    data_dir, shards = source
+    return make_dataset(data_dir, subset, batch=batch, shards_dir=shards)[0]
+
+
+def representative_dataset(num_samples, source):
+    ds = load_split("training", source, batch=1).take(num_samples)
+
+    def gen():
+        for images, _ in ds:
+            # same normalization as preprocess.InputWriter applies at runtime
+            yield [images / 127.5 - 1.0]
+    return gen
+
+
+def convert(variant, num_samples, source):
+    conv = tf.lite.TFLiteConverter.from_saved_model(str(SAVED_MODEL_DIR))
+    conv.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "f16":
+        conv.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        conv.representative_dataset = representative_dataset(num_samples, source)
+        conv.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        conv.inference_input_type = tf.uint8
+        conv.inference_output_type = tf.uint8
+    return conv.convert()
+
+
+def evaluate(model_path, val_ds, num_threads):
+    backend = TFLiteBackend(model_path, num_threads=num_threads)
+    correct = total = 0
+    for images, labels in val_ds:
+        for img, label in zip(images.numpy().astype(np.uint8), labels.numpy()):
+            correct += int(np.argmax(backend.predict(img)) == label)
+            total += 1
+    stats = backend.latency_stats()
+    return {
+        "size_mb": Path(model_path).stat().st_size / 1e6,
+        "latency_ms": stats.get("mean_ms", float("nan")),
+        "accuracy": correct / max(total, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--samples", type=int, default=200,
+                        help="representative images for int8 calibration")
+    parser.add_argument("--max-drop", type=float, default=0.01,
+                        help="maximum accepted accuracy drop vs float32 (0.01 = 1 point)")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--shards", type=Path,
+                        help="shard directory the model was trained on (default: from models/data_split.json)")
+    args = parser.parse_args()
+
+    CANDIDATES.mkdir(parents=True, exist_ok=True)
+    source = split_source(args.shards)
+    print(f"[Info] split from {source[1] or source[0]}")
+    val_ds = load_split("validation", source)
+
+    print(f"Evaluating float32 baseline {BASELINE} …")
+    results = {"f32": evaluate(BASELINE, val_ds, args.threads)}
+    baseline_acc = results["f32"]["accuracy"]
+
+    for variant in args.variants:
+        out = CANDIDATES / VARIANTS[variant]
+        print(f"Converting {variant} …")
+        out.write_bytes(convert(variant, args.samples, source))
+        results[variant] = evaluate(out, val_ds, args.threads)
+
+    print(f"\n{'variant':<8} {'size MB':>8} {'latency ms':>11} {'accuracy':>9} {'drop':>7}  status")
+    for variant, r in results.items():
+        r["drop"] = baseline_acc - r["accuracy"]
+        if variant == "f32":
+            r["status"] = "baseline"
+        elif r["drop"] > args.max_drop:
+            r["status"] = "rejected"
+            # never leave an older published copy behind for backend.MODEL_CHAIN to pick up
+            (Path("models") / VARIANTS[variant]).unlink(missing_ok=True)
+        else:
+            shutil.copy2(CANDIDATES / VARIANTS[variant], Path("models") / VARIANTS[variant])
+            r["status"] = "published"
+        print(f"{variant:<8} {r['size_mb']:>8.2f} {r['latency_ms']:>11.2f} "
+              f"{r['accuracy']:>9.4f} {r['drop']:>+7.4f}  {r['status']}")
+
+    REPORT.write_text(json.dumps({"max_drop": args.max_drop, "results": results}, indent=2))
+    print(f"✓ Report saved to {REPORT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Sharded, memory-mappable record format for the training images.
+
+    data/shards/index.json          classes, image size and shard list
+    data/shards/images-00000.npy    uint8 array (n, size, size, 3), RGB
+    data/shards/labels-00000.npy    int32 array (n,)
+
+Shards are plain .npy files, so a reader can np.load(..., mmap_mode="r")
+them and stream records without touching thousands of small files.
+"""
+import json
+from pathlib import Path
+import numpy as np
+
+SHARD_DIR = Path("data/shards")
+SHARD_SIZE = 1024
+VAL_FRACTION = 0.2
+
+
+class ShardWriter:
+    def __init__(self, out_dir=SHARD_DIR, classes=(), image_size=224, shard_size=SHARD_SIZE):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        for old in self.out_dir.glob("*-?????.npy"):
+            old.unlink()
+        self.classes = list(classes)
+        self.image_size = image_size
+        self.images = np.empty((shard_size, image_size, image_size, 3), np.uint8)
+        self.labels = np.empty(shard_size, np.int32)
+        self.count = 0
+        self.shards = []
+
+    def add(self, img: np.ndarray, label: int) -> None:
+        self.images[self.count] = img
+        self.labels[self.count] = label
+        self.count += 1
+        if self.count == len(self.labels):
+            self._flush()
+
+    def _flush(self):
+        if not self.count:
+            return
+        n = len(self.shards)
+        np.save(self.out_dir/f"images-{n:05d}.npy", self.images[:self.count])
+        np.save(self.out_dir/f"labels-{n:05d}.npy", self.labels[:self.count])
+        self.shards.append({"images": f"images-{n:05d}.npy", "labels": f"labels-{n:05d}.npy",
+                            "count": self.count})
+        self.count = 0
+
+    def close(self) -> dict:
+        self._flush()
+        index = {"classes": self.classes, "image_size": self.image_size, "shards": self.shards}
+        tmp = self.out_dir/"index.json.tmp"
+        tmp.write_text(json.dumps(index, indent=1))
+        tmp.replace(self.out_dir/"index.json")
+        return index
+
+
+def load_index(shard_dir=SHARD_DIR) -> dict:
+    return json.loads((Path(shard_dir)/"index.json").read_text())
+
+
+def split_mask(shard_no: int, count: int, subset: str, val_fraction=VAL_FRACTION):
+    """
+    Deterministic per-record train/validation split (seeded by shard number).
+    """
+    is_val = np.random.default_rng(42 + shard_no).random(count) < val_fraction
+    return is_val if subset == "validation" else ~is_val
+
+
+def iter_shard(shard_dir, shard_no, subset=None, shuffle=False, seed=None, val_fraction=VAL_FRACTION):
+    """
+    Yield (image, label) records of a single memory-mapped shard.
+    Also used as a tf.data generator, which passes strings as bytes.
+    """
+    if isinstance(shard_dir, bytes): shard_dir = shard_dir.decode()
+    if isinstance(subset, bytes): subset = subset.decode()
+    shard_dir = Path(shard_dir)
+    shard_no = int(shard_no)
+    shard = load_index(shard_dir)["shards"][shard_no]
+    images = np.load(shard_dir/shard["images"], mmap_mode="r")
+    labels = np.load(shard_dir/shard["labels"])
+    order = np.arange(shard["count"])
+    if subset is not None:
+        order = order[split_mask(shard_no, shard["count"], subset, val_fraction)]
+    if shuffle:
+        np.random.default_rng(seed).shuffle(order)
+    for i in order:
+        yield images[i], labels[i]
+
+
+def iter_records(shard_dir=SHARD_DIR, subset=None, shuffle=False, seed=None, val_fraction=VAL_FRACTION):
+    """
+    Yield (image, label) records, memory-mapping one shard at a time.
+    subset: None for all records, or "training" / "validation".
+    """
+    rng = np.random.default_rng(seed)
+    order = np.arange(len(load_index(shard_dir)["shards"]))
+    if shuffle:
+        rng.shuffle(order)
+    for shard_no in order:
+        yield from iter_shard(shard_dir, int(shard_no), subset, shuffle, rng.integers(1 << 31), val_fraction)
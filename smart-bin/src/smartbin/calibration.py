@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+'''
+Calibration store for the SmartBin servos.
+
+The robot_hat config file ("key = value" lines, '#' comments) is parsed once
+on load; afterwards reads are served from memory. Writes only mark the
+store dirty and arm a short timer, so a calibration session that nudges a
+servo many times per second turns into one write. A flush rewrites the file
+through a temporary file and os.replace(), so a power cut leaves either the
+old or the new file, never a truncated one. Lines the store does not own
+(other robots sharing the file, comments) are kept as they are.
+
+Keys are prefixed with a profile name, so several bins can keep their
+values in one file: "<profile>_servo_p0" for the calibration offset (the
+historical key names for the default "smartbin" profile) and
+"<profile>_open_angle_p0" for the angle the flap opens to.
+'''
+import atexit
+import os
+import tempfile
+import threading
+
+HEADER = '# robot-hat config and calibration value of robots\n\n'
+
+
+class CalibrationStore(object):
+    '''
+    path:        config file, created on the first flush if missing.
+    profile:     key prefix of this bin.
+    flush_delay: seconds a change may wait before it is written; changes
+                 arriving in that window are coalesced into one write.
+    owner:       optional user name the file is chowned to when created.
+    timer:       Timer(seconds, function) factory for the flush delay.
+    '''
+
+    def __init__(self, path, profile='smartbin', flush_delay=2.0, owner=None, timer=threading.Timer):
+        self.path = path
+        self.profile = profile
+        self.flush_delay = flush_delay
+        self.owner = owner
+        self._make_timer = timer
+        self.writes = 0
+        self._lines = []
+        self._values = {}
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.RLock()
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        '''
+        (Re)reads the whole file in one pass. Pending changes are dropped.
+        '''
+        with self._lock:
+            self._lines, self._values, self._dirty = [], {}, set()
+            try:
+                with open(self.path) as f:
+                    self._lines = f.read().splitlines()
+            except FileNotFoundError:
+                self._lines = HEADER.splitlines()
+                return
+            for line in self._lines:
+                if '=' in line and not line.lstrip().startswith('#'):
+                    key, _, value = line.partition('=')
+                    self._values[key.strip()] = value.strip()
+
+    def key(self, name, channel=None):
+        return '%s_%s' % (self.profile, name if channel is None else '%s_p%d' % (name, channel))
+
+    def get(self, name, channel=None, default=None, type=float):
+        value = self._values.get(self.key(name, channel))
+        if value is None:
+            return default
+        try:
+            return type(value)
+        except ValueError:
+            return default
+
+    def get_list(self, name, channels, defaults, type=float):
+        return [self.get(name, ch, default, type) for ch, default in zip(channels, defaults)]
+
+    def set(self, name, value, channel=None):
+        '''
+        Updates a value in memory and schedules a flush.
+        '''
+        key = self.key(name, channel)
+        with self._lock:
+            if self._values.get(key) == str(value):
+                return
+            self._values[key] = str(value)
+            self._dirty.add(key)
+            if self._timer is None:
+                self._timer = self._make_timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        '''
+        Writes pending changes, if any, atomically.
+        '''
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            lines, seen = [], set()
+            for line in self._lines:
+                key = line.partition('=')[0].strip() if '=' in line and not line.lstrip().startswith('#') else None
+                if key in self._dirty:
+                    line = '%s = %s' % (key, self._values[key])
+                    seen.add(key)
+                lines.append(line)
+            lines += ['%s = %s' % (key, self._values[key]) for key in sorted(self._dirty - seen)]
+            self._write(lines)
+            self._lines = lines
+            self._dirty.clear()
+            self.writes += 1
+
+    def _write(self, lines):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        fd, tmp = tempfile.mkstemp(prefix='.calibration-', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if st is not None:
+                os.chmod(tmp, st.st_mode & 0o7777)
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except PermissionError:
+                    pass
+            else:
+                os.chmod(tmp, 0o666)
+                if self.owner is not None:
+                    try:
+                        import pwd
+                        pw = pwd.getpwnam(self.owner)
+                        os.chown(tmp, pw.pw_uid, pw.pw_gid)
+                    except (KeyError, PermissionError):
+                        pass
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+'''
+Per-compartment fill estimation and time-to-full forecasting.
+
+The bin has a single ultrasonic sensor, so the fill of each compartment is
+estimated from the items routed into it: every item adds a nominal volume
+(a fraction of the compartment), and the ultrasonic level, which sees the
+fullest heap, rescales those volumes through a slowly adapting correction
+factor. Arrival rates are exponentially decayed counters (one float and a
+timestamp per compartment), so memory stays constant however long the bin
+runs. The time-to-full forecast is the remaining volume divided by the
+current volume rate.
+
+The fullness monitor thread (observe, empty) and the sorting loop (record)
+update the model concurrently; every method holds one re-entrant lock.
+'''
+import json
+import math
+import os
+import threading
+import time
+
+
+class _Compartment(object):
+    __slots__ = ('items', 'rate', 'last', 'emptied')
+
+    def __init__(self, now):
+        self.items = 0
+        self.rate = 0.0          # decayed arrivals per second
+        self.last = now
+        self.emptied = now
+
+
+class FillModel(object):
+    '''
+    compartments: number of compartments (flaps).
+    capacity:     nominal number of items that fill one compartment, either
+                  a single number or one per compartment.
+    horizon:      time constant in seconds of the arrival-rate estimator.
+    alpha:        adaptation rate of the ultrasonic correction.
+    '''
+
+    def __init__(self, compartments=4, capacity=60, horizon=3600.0, alpha=0.2, clock=time.time):
+        if isinstance(capacity, (int, float)):
+            capacity = [capacity] * compartments
+        if len(capacity) != compartments:
+            raise ValueError("expected %d capacities, got %d" % (compartments, len(capacity)))
+        self.item_volume = [1.0 / c for c in capacity]
+        self.horizon = horizon
+        self.alpha = alpha
+        self.scale = 1.0
+        self._clock = clock
+        self._lock = threading.RLock()
+        now = clock()
+        self.compartments = [_Compartment(now) for _ in range(compartments)]
+
+    def _decayed_rate(self, comp, now):
+        return comp.rate * math.exp(-(now - comp.last) / self.horizon)
+
+    def record(self, compartment, now=None):
+        '''
+        Counts one item routed into `compartment`.
+        '''
+        with self._lock:
+            now = self._clock() if now is None else now
+            comp = self.compartments[compartment]
+            comp.rate = self._decayed_rate(comp, now) + 1.0 / self.horizon
+            comp.last = now
+            comp.items += 1
+
+    def fill(self, compartment):
+        '''
+        Estimated fill of `compartment` in [0, 1].
+        '''
+        with self._lock:
+            comp = self.compartments[compartment]
+            return min(1.0, comp.items * self.item_volume[compartment] * self.scale)
+
+    def observe(self, level):
+        '''
+        Folds in an ultrasonic fill level in [0, 1] (FullnessMonitor.level(),
+        where 1 is the level at which the bin reports full).
+        The sensor sees the fullest heap, so the highest estimate is pulled
+        towards it. A near-empty reading after a fill means the bin was emptied.
+        '''
+        with self._lock:
+            if level is None:
+                return
+            estimates = [c.items * v for c, v in zip(self.compartments, self.item_volume)]
+            predicted = max(estimates)
+            if predicted * self.scale > 0.3 and level < 0.05:
+                self.empty()
+                return
+            # too few items for the heap height to say anything about the volumes
+            if predicted <= 0 or level < 0.1:
+                return
+            self.scale += self.alpha * (level / predicted - self.scale)
+            self.scale = max(0.2, min(5.0, self.scale))
+
+    def empty(self, compartment=None):
+        '''
+        Resets one compartment, or all of them, after collection.
+        '''
+        with self._lock:
+            now = self._clock()
+            targets = range(len(self.compartments)) if compartment is None else [compartment]
+            for i in targets:
+                self.compartments[i].items = 0
+                self.compartments[i].emptied = now
+
+    def eta(self, compartment, now=None):
+        '''
+        Forecast seconds until `compartment` is full at the current arrival
+        rate, 0 when already full, or None when nothing is arriving.
+        '''
+        with self._lock:
+            now = self._clock() if now is None else now
+            remaining = 1.0 - self.fill(compartment)
+            if remaining <= 0:
+                return 0.0
+            comp = self.compartments[compartment]
+            rate = self._decayed_rate(comp, now) * self.item_volume[compartment] * self.scale
+            if rate <= 1e-12:
+                return None
+            return remaining / rate
+
+    def report(self, now=None):
+        '''
+        One dict per compartment: items, fill, items_per_hour, eta_s.
+        '''
+        with self._lock:
+            now = self._clock() if now is None else now
+            return [{
+                'compartment': i,
+                'items': comp.items,
+                'fill': round(self.fill(i), 3),
+                'items_per_hour': round(self._decayed_rate(comp, now) * 3600, 2),
+                'eta_s': self.eta(i, now),
+            } for i, comp in enumerate(self.compartments)]
+
+    def next_full(self, now=None):
+        '''
+        (compartment, eta_s) of the compartment expected to fill first, or None.
+        '''
+        with self._lock:
+            etas = [(eta, i) for i, eta in enumerate(self.eta(i, now) for i in range(len(self.compartments)))
+                    if eta is not None]
+            if not etas:
+                return None
+            eta, i = min(etas)
+            return i, eta
+
+    def save(self, path):
+        '''
+        Writes the estimator state atomically, so counts survive restarts.
+        '''
+        with self._lock:
+            state = {'scale': self.scale, 'item_volume': self.item_volume,
+                     'compartments': [{k: getattr(c, k) for k in _Compartment.__slots__}
+                                      for c in self.compartments]}
+            tmp = '%s.tmp' % path
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, path)
+
+    def load(self, path):
+        '''
+        Restores state written by save(). Missing or mismatched files are ignored.
+        '''
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if len(state.get('compartments', [])) != len(self.compartments):
+            return False
+        with self._lock:
+            self.scale = state['scale']
+            for comp, saved in zip(self.compartments, state['compartments']):
+                for k in _Compartment.__slots__:
+                    setattr(comp, k, saved[k])
+        return True
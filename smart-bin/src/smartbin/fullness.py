@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+'''
+Background fullness monitoring for the SmartBin.
+
+The ultrasonic sensor is sampled by a daemon thread at a low rate instead of
+in bursts on the item path. Invalid echoes (timeouts are reported as
+negative values) and readings outside the sensor range are dropped, the
+rest go through a running median, and the full/clear decision uses
+hysteresis so a reading hovering at the threshold does not toggle the
+state. Readers get the last published state without touching the sensor.
+'''
+import statistics
+import threading
+from collections import deque
+
+
+def _wait(event, seconds):
+    return event.wait(seconds)
+
+
+class FullnessMonitor(object):
+    '''
+    read:      callable returning a distance in cm (e.g. Ultrasonic.read).
+    interval:  seconds between samples.
+    window:    number of valid samples in the running median.
+    full_cm:   the bin is full once the median distance drops below this.
+    clear_cm:  ...and counts as emptied again only above this (> full_cm).
+    depth_cm:  distance measured on an empty bin, used for level().
+    wait:      wait(event, seconds) between samples (hardware.wait follows
+               the simulated clock).
+    '''
+
+    MIN_CM = 2.0
+    MAX_CM = 400.0
+
+    def __init__(self, read, interval=1.0, window=5, full_cm=10.0, clear_cm=14.0, depth_cm=40.0,
+                 wait=_wait):
+        if clear_cm < full_cm:
+            raise ValueError("clear_cm must not be below full_cm")
+        if depth_cm <= full_cm:
+            raise ValueError("depth_cm must be above full_cm")
+        self.read = read
+        self.interval = interval
+        self.full_cm = full_cm
+        self.clear_cm = clear_cm
+        self.depth_cm = depth_cm
+        self._wait = wait
+        self.full = False
+        self.distance = None
+        self.samples = deque(maxlen=window)
+        self.errors = 0
+        self._callbacks = []
+        self._sample_callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_callback(self, callback):
+        '''
+        Registers callback(full, distance), called from the monitor thread
+        whenever the full state changes.
+        '''
+        self._callbacks.append(callback)
+
+    def add_sample_callback(self, callback):
+        '''
+        Registers callback(distance), called with the filtered distance after
+        every valid sample.
+        '''
+        self._sample_callbacks.append(callback)
+
+    def level(self):
+        '''
+        Fill level in [0, 1] from the filtered distance, or None before the
+        first valid sample. 0 is an empty bin (depth_cm) and 1 the full_cm
+        threshold, so level 1 means the same as `full`.
+        '''
+        distance = self.distance
+        if distance is None:
+            return None
+        return max(0.0, min(1.0, (self.depth_cm - distance) / (self.depth_cm - self.full_cm)))
+
+    def sample(self):
+        '''
+        Takes one reading and updates the published state. Returns the
+        filtered distance (None while no valid sample was seen).
+        '''
+        try:
+            value = self.read()
+        except Exception:
+            value = -1
+        if value is None or not self.MIN_CM <= value <= self.MAX_CM:
+            self.errors += 1
+            return self.distance
+        with self._lock:
+            self.samples.append(value)
+            distance = statistics.median(self.samples)
+            self.distance = distance
+            changed = False
+            if not self.full and distance < self.full_cm:
+                self.full = changed = True
+            elif self.full and distance > self.clear_cm:
+                self.full, changed = False, True
+        for callback in self._sample_callbacks:
+            callback(distance)
+        if changed:
+            for callback in self._callbacks:
+                callback(self.full, distance)
+        return distance
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='smartbin-fullness', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._wait(self._stop, self.interval)
+
+
+class Blinker(object):
+    '''
+    Blinks an output (callable(0|1), e.g. Pin.value) from its own thread.
+    '''
+
+    def __init__(self, set_value, period=0.3, wait=_wait):
+        self.set_value = set_value
+        self.period = period
+        self._wait = wait
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_on(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.is_on():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='smartbin-blink', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.set_value(0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.set_value(1)
+            if self._wait(self._stop, self.period):
+                break
+            self.set_value(0)
+            self._wait(self._stop, self.period)
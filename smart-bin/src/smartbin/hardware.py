@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+'''
+Hardware backend selection.
+
+robot_hat is used on the Pi. Only with SMARTBIN_SIM=1 are the simulated
+devices from sim.py used instead, together with their (possibly
+accelerated) clock; a missing or broken robot_hat is an error, so a bin
+never "routes" items without moving a servo. wait(event, seconds) and
+Timer(seconds, function) are the interruptible wait and one-shot timer of
+the same clock, for the background threads.
+'''
+import os
+import threading
+import time
+
+SIMULATED = bool(os.environ.get('SMARTBIN_SIM'))
+
+if not SIMULATED:
+    try:
+        from robot_hat import Pin, Servo, Ultrasonic, utils
+    except ImportError as e:
+        raise ImportError("robot_hat is required to drive the bin; set SMARTBIN_SIM=1 "
+                          "to use the simulated hardware") from e
+
+if SIMULATED:
+    from .sim import Pin, Servo, Ultrasonic, utils, clock, sleep, wait, Timer
+else:
+    clock, sleep = time.monotonic, time.sleep
+    Timer = threading.Timer
+
+    def wait(event, seconds):
+        return event.wait(seconds)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+'''
+Timer-driven motion engine for the SmartBin flaps.
+
+All servos are driven from a single scheduler thread. A motion is a set of
+per-channel tracks (start angle, end angle, delay, duration) that are sampled
+together on every tick, so the target flap and its neighbours move in one
+pass instead of one Python loop per flap.
+'''
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+
+def linear(t):
+    return t
+
+
+def ease_in(t):
+    return t * t
+
+
+def ease_out(t):
+    return 1 - (1 - t) * (1 - t)
+
+
+def ease_in_out(t):
+    return 0.5 - 0.5 * math.cos(math.pi * t)
+
+
+EASINGS = {
+    'linear': linear,
+    'ease_in': ease_in,
+    'ease_out': ease_out,
+    'ease_in_out': ease_in_out,
+}
+
+
+def get_easing(easing):
+    '''
+    Resolves an easing name or callable to a callable mapping [0, 1] -> [0, 1].
+    '''
+    if callable(easing):
+        return easing
+    try:
+        return EASINGS[easing]
+    except KeyError:
+        raise ValueError("unknown easing %r, expected one of %s" % (easing, sorted(EASINGS)))
+
+
+class MotionHandle(object):
+    '''
+    Returned by MotionEngine.move(). Can be joined from a thread or awaited
+    from a coroutine.
+    '''
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.cancelled = False
+
+    def done(self):
+        return self._done.is_set()
+
+    def join(self, timeout=None):
+        '''
+        Blocks until the motion finished. Returns False on timeout.
+        '''
+        return self._done.wait(timeout)
+
+    def __await__(self):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(None, self._done.wait).__await__()
+
+    def _finish(self, cancelled=False):
+        self.cancelled = cancelled
+        self._done.set()
+
+
+class _Track(object):
+    __slots__ = ('channel', 'target', 'delay', 'duration', 'start')
+
+    def __init__(self, channel, target, delay, duration):
+        self.channel = channel
+        self.target = target
+        self.delay = delay
+        self.duration = duration
+        self.start = None
+
+
+class _Motion(object):
+    def __init__(self, tracks, easing, handle):
+        self.tracks = tracks
+        self.easing = easing
+        self.handle = handle
+        self.t0 = None
+        self.end = max([tr.delay + tr.duration for tr in tracks] or [0])
+
+
+class MotionEngine(object):
+    '''
+    Plans and plays trajectories for a group of servo channels.
+
+    setters: mapping of channel -> callable(angle) that drives the hardware,
+             or a ServoBank-like object (len() channels and set_many(mapping))
+             that receives every tick's changes in one call.
+    rate:    scheduler tick rate in Hz.
+    easing:  default easing name or callable.
+
+    Motions are queued and played back to back; each one starts from the
+    angles the previous one left the channels at.
+    '''
+
+    def __init__(self, setters, rate=50, easing='ease_in_out',
+                 clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if hasattr(setters, 'set_many'):
+            self.channels = list(range(len(setters)))
+            self._write = setters.set_many
+        else:
+            setters = dict(setters)
+            self.channels = list(setters)
+
+            def write(changes):
+                for ch, angle in changes.items():
+                    setters[ch](angle)
+            self._write = write
+        self.rate = rate
+        self.easing = get_easing(easing)
+        self.positions = {ch: 0.0 for ch in self.channels}
+        self._clock = clock
+        self._sleep = sleep
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = True
+
+    def move(self, targets, duration, easing=None, delays=None, durations=None):
+        '''
+        Queues a motion of the channels in `targets` (channel -> angle).
+
+        duration:  default time in seconds for every track.
+        delays:    optional channel -> start offset in seconds.
+        durations: optional channel -> per-track duration overriding `duration`.
+        '''
+        delays = delays or {}
+        durations = durations or {}
+        tracks = []
+        for ch, target in targets.items():
+            if ch not in self.positions:
+                raise KeyError("unknown servo channel %r" % (ch,))
+            tracks.append(_Track(ch, float(target),
+                                 max(0.0, delays.get(ch, 0.0)),
+                                 max(0.0, durations.get(ch, duration))))
+        handle = MotionHandle()
+        motion = _Motion(tracks, get_easing(easing) if easing is not None else self.easing, handle)
+        with self._cond:
+            self._queue.append(motion)
+            self._ensure_thread()
+            self._cond.notify()
+        return handle
+
+    def sync(self, angles):
+        '''
+        Records channel -> angle positions set outside the engine (direct
+        writes, calibration), so the next motion starts from them.
+        '''
+        with self._cond:
+            for ch, angle in angles.items():
+                if ch not in self.positions:
+                    raise KeyError("unknown servo channel %r" % (ch,))
+                self.positions[ch] = float(angle)
+
+    def cancel(self):
+        '''
+        Drops all queued motions and halts the current one where it is.
+        '''
+        with self._cond:
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for motion in pending:
+            motion.handle._finish(cancelled=True)
+
+    def wait_idle(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue, timeout)
+
+    def shutdown(self):
+        self.cancel()
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='smartbin-motion', daemon=True)
+            self._thread.start()
+
+    def _step(self, motion, now):
+        '''
+        Samples every track of `motion` at time `now` and writes the changed
+        channels in one call. Returns True when done.
+        '''
+        if motion.t0 is None:
+            motion.t0 = now
+            for tr in motion.tracks:
+                tr.start = self.positions[tr.channel]
+        t = now - motion.t0
+        changes = {}
+        for tr in motion.tracks:
+            if t < tr.delay:
+                continue
+            if tr.duration <= 0 or t >= tr.delay + tr.duration:
+                angle = tr.target
+            else:
+                k = motion.easing((t - tr.delay) / tr.duration)
+                angle = tr.start + (tr.target - tr.start) * k
+            if self.positions[tr.channel] != angle:
+                self.positions[tr.channel] = angle
+                changes[tr.channel] = angle
+        if changes:
+            self._write(changes)
+        return t >= motion.end
+
+    def _run(self):
+        period = 1.0 / self.rate
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                motion = self._queue[0]
+            next_tick = self._clock()
+            while True:
+                with self._cond:
+                    if not self._queue or self._queue[0] is not motion:
+                        break
+                    finished = self._step(motion, self._clock())
+                    if finished:
+                        self._queue.popleft()
+                        self._cond.notify_all()
+                if finished:
+                    motion.handle._finish()
+                    break
+                # absolute deadlines so the tick rate does not drift with setter cost
+                next_tick += period
+                delay = next_tick - self._clock()
+                if delay > 0:
+                    self._sleep(delay)
+                else:
+                    next_tick = self._clock()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+'''
+Array-backed state for a bank of flap servos.
+
+Calibration offsets, limits, commanded angles and the raw angles last sent
+to the PWM driver are kept in flat arrays indexed by channel, so any number
+of flaps shares one code path. set_many() takes a whole pose (or one tick of
+a motion) at once, clamps it and writes only the channels whose raw angle
+actually changed, in a single pass over the bank. The motion thread and
+calibration calls from the main thread share the bank under one lock.
+'''
+import math
+import threading
+from array import array
+
+
+class ServoBank(object):
+    '''
+    servos:  one robot_hat Servo (anything with .angle(value)) per channel.
+    offsets: calibration value per channel, i.e. the raw angle of the closed flap.
+    lo, hi:  limits of the commanded angle, a number or one per channel.
+    '''
+
+    def __init__(self, servos, offsets, lo=-360, hi=360):
+        n = len(servos)
+        if len(offsets) != n:
+            raise ValueError("expected %d calibration values, got %d" % (n, len(offsets)))
+        self.servos = list(servos)
+        self.offset = array('d', offsets)
+        self.lo = array('d', lo if hasattr(lo, '__len__') else [lo] * n)
+        self.hi = array('d', hi if hasattr(hi, '__len__') else [hi] * n)
+        self.angle = array('d', [0.0] * n)
+        self.written = array('d', [math.nan] * n)
+        self.writes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.servos)
+
+    def set_many(self, angles):
+        '''
+        Commands several channels at once: a mapping channel -> angle, or a
+        sequence with one angle per channel.
+        '''
+        items = angles.items() if hasattr(angles, 'items') else enumerate(angles)
+        with self._lock:
+            offset, lo, hi, angle, written = self.offset, self.lo, self.hi, self.angle, self.written
+            for ch, value in items:
+                value = lo[ch] if value < lo[ch] else hi[ch] if value > hi[ch] else value
+                angle[ch] = value
+                raw = offset[ch] - value
+                if raw != written[ch]:
+                    written[ch] = raw
+                    self.servos[ch].angle(raw)
+                    self.writes += 1
+
+    def set(self, ch, value):
+        self.set_many({ch: value})
+
+    def calibrate(self, ch, offset):
+        '''
+        Sets the closed position of channel `ch` and moves the flap there.
+        '''
+        with self._lock:
+            self.offset[ch] = offset
+            self.angle[ch] = 0.0
+            self.written[ch] = offset
+            self.servos[ch].angle(offset)
+            self.writes += 1
+
+    def apply(self):
+        '''
+        Re-sends every channel, e.g. after the PWM driver was reset.
+        '''
+        with self._lock:
+            self.written = array('d', [math.nan] * len(self))
+            self.set_many(list(self.angle))
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+'''
+Simulated hardware for running the SmartBin off-device.
+
+Drop-in stand-ins for the parts of robot_hat, Picamera2 and gpiozero the
+bin uses:
+
+  Servo       slews towards its target at a finite speed, like an SG90
+  Ultrasonic  noisy distance readings with occasional dropped echoes
+  Pin, utils  no-ops (LED state is recorded)
+  Camera      replays a directory of images or a video at a target FPS
+  GpioServo   gpiozero.Servo replacement for hardware_control.py
+
+All simulated delays go through `clock` / `sleep` (and `wait` / `Timer` for
+the SmartBin's background threads), which run `speed` times faster than
+real time, so whole item loops can be replayed accelerated.
+Select the simulator with SMARTBIN_SIM=1 (see hardware.py); SMARTBIN_SIM_SPEED
+sets the speed-up.
+'''
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class SimWorld(object):
+    '''
+    Shared state of the simulated bin. Tests and load scripts poke at the
+    module-level `world` instance.
+    '''
+
+    def __init__(self, speed=1.0, distance_cm=40.0, noise_cm=0.5, dropout=0.02,
+                 slew_deg_per_s=600.0, seed=0):
+        self.speed = speed
+        self.distance_cm = distance_cm
+        self.noise_cm = noise_cm
+        self.dropout = dropout
+        self.slew_deg_per_s = slew_deg_per_s
+        self.rng = random.Random(seed)
+        self.servo_writes = 0
+        self.servo_travel = 0.0
+        self.ultrasonic_reads = 0
+        self._t0 = time.monotonic()
+
+    def clock(self):
+        '''
+        Simulated monotonic time in seconds.
+        '''
+        return (time.monotonic() - self._t0) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def wait(self, event, seconds):
+        '''
+        event.wait() for `seconds` of simulated time.
+        '''
+        return event.wait(seconds / self.speed)
+
+    def timer(self, seconds, function):
+        return threading.Timer(seconds / self.speed, function)
+
+
+world = SimWorld(speed=float(os.environ.get('SMARTBIN_SIM_SPEED', 1.0)))
+
+
+def clock():
+    return world.clock()
+
+
+def sleep(seconds):
+    world.sleep(seconds)
+
+
+def wait(event, seconds):
+    return world.wait(event, seconds)
+
+
+def Timer(seconds, function):
+    return world.timer(seconds, function)
+
+
+class Pin(object):
+    IN = 1
+    OUT = 2
+    PULL_UP = 0x11
+    PULL_DOWN = 0x12
+
+    def __init__(self, pin, mode=None, pull=None):
+        self.pin = pin
+        self._value = 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+        return value
+
+    def on(self):
+        return self.value(1)
+
+    def off(self):
+        return self.value(0)
+
+
+class Servo(object):
+    '''
+    Servo whose horn moves towards the last commanded angle at
+    world.slew_deg_per_s; position() reports where it is now.
+    '''
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.target = 0.0
+        self._from = 0.0
+        self._t = clock()
+
+    def position(self):
+        travel = (clock() - self._t) * world.slew_deg_per_s
+        delta = self.target - self._from
+        if abs(delta) <= travel:
+            return self.target
+        return self._from + travel * (1 if delta > 0 else -1)
+
+    def settled(self):
+        return self.position() == self.target
+
+    def angle(self, angle):
+        start = self.position()
+        world.servo_writes += 1
+        world.servo_travel += abs(angle - start)
+        self._from, self._t, self.target = start, clock(), float(angle)
+
+
+class Ultrasonic(object):
+    '''
+    Returns world.distance_cm plus Gaussian noise; a fraction world.dropout
+    of the readings time out and return -1, like a missed echo.
+    '''
+    TIMEOUT = 0.02
+
+    def __init__(self, trig, echo, timeout=TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def read(self):
+        with self._lock:
+            world.ultrasonic_reads += 1
+            if world.rng.random() < world.dropout:
+                sleep(self.timeout)
+                return -1
+            distance = max(2.0, world.rng.gauss(world.distance_cm, world.noise_cm))
+            # round trip of the ping at the speed of sound
+            sleep(distance * 2 / 34300.0)
+            return round(distance, 2)
+
+
+class utils(object):
+    @staticmethod
+    def reset_mcu():
+        pass
+
+
+class Camera(object):
+    '''
+    Picamera2 stand-in replaying `source` (a directory of images or a video
+    file) in a loop at `fps` simulated frames per second (0 = as fast as
+    possible). Frames are resized to the configured size and keep OpenCV's
+    BGR byte order, which is what Picamera2's "RGB888" format delivers.
+    '''
+
+    def __init__(self, source, fps=15.0, loop=True):
+        import cv2
+        self.cv2 = cv2
+        self.source = Path(source)
+        self.fps = fps
+        self.loop = loop
+        self.size = None
+        self.frames_captured = 0
+        self._next = None
+        self._video = None
+        self._images = None
+        if self.source.is_dir():
+            self._images = sorted(p for p in self.source.rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES)
+            if not self._images:
+                raise FileNotFoundError("no images in %s" % self.source)
+            self._cache = {}
+        elif self.source.is_file():
+            self._video = cv2.VideoCapture(str(self.source))
+            if not self._video.isOpened():
+                raise IOError("cannot open video %s" % self.source)
+        else:
+            raise FileNotFoundError(self.source)
+
+    def create_preview_configuration(self, main=None, **kwargs):
+        return {'main': dict(main or {})}
+
+    def configure(self, config):
+        size = config.get('main', {}).get('size')
+        self.size = tuple(size) if size else None
+
+    def start(self):
+        self._next = clock()
+
+    def stop(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+
+    def _read(self):
+        if self._images is not None:
+            i = self.frames_captured % len(self._images)
+            if not self.loop and self.frames_captured >= len(self._images):
+                raise EOFError("end of %s" % self.source)
+            frame = self._cache.get(i)
+            if frame is None:
+                frame = self.cv2.imread(str(self._images[i]))
+                if self.size:
+                    frame = self.cv2.resize(frame, self.size)
+                self._cache[i] = frame
+            return frame.copy()
+        ok, frame = self._video.read()
+        if not ok and self.loop:
+            self._video.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._video.read()
+        if not ok:
+            raise EOFError("end of %s" % self.source)
+        return self.cv2.resize(frame, self.size) if self.size else frame
+
+    def capture_array(self, name='main'):
+        if self._next is None:
+            self.start()
+        if self.fps:
+            # pace on absolute deadlines like a free-running sensor
+            self._next += 1.0 / self.fps
+            sleep(self._next - clock())
+        frame = self._read()
+        self.frames_captured += 1
+        return frame
+
+
+class GpioServo(object):
+    '''
+    gpiozero.Servo stand-in: value in [-1, 1], min() / mid() / max().
+    '''
+
+    def __init__(self, pin, min_pulse_width=1 / 1000, max_pulse_width=2 / 1000, **kwargs):
+        self.pin = pin
+        self._servo = Servo(pin)
+        self.value = 0.0
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._servo.angle(value * 90)
+
+    def min(self):
+        self.value = -1.0
+
+    def mid(self):
+        self.value = 0.0
+
+    def max(self):
+        self.value = 1.0
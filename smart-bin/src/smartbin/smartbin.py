@@ -1,201 +1,286 @@
-from robot_hat import Pin, ADC, PWM, Servo, fileDB
-from robot_hat import Grayscale_Module, Ultrasonic, utils
+from .hardware import Pin, Servo, Ultrasonic, utils, clock, sleep, wait, Timer
+from .motion import MotionEngine
+from .fullness import FullnessMonitor, Blinker
+from .fill import FillModel
+from .calibration import CalibrationStore
+from .servo_bank import ServoBank
+import getpass
+import threading
 import time
 import os
 
 
-def constrain(x, min_val, max_val):
+def _login():
+    try:
+        return os.getlogin()
+    except OSError:
+        # no controlling terminal (services, CI)
+        return getpass.getuser()
+
+
+def ring_poses(n, tilt):
     '''
-    Constrains value to be within a range.
+    Pose table for n flaps arranged in a ring: opening flap i tilts the
+    opposite flap by `tilt` and its two neighbours by half of it, so the
+    item slides towards the open compartment.
+    Returns {flap: {channel: angle}} without the opened flap itself.
     '''
-    return max(min_val, min(max_val, x))
+    poses = {}
+    for i in range(n):
+        pose = {(i - 1) % n: tilt / 2, (i + 1) % n: tilt / 2, (i + n // 2) % n: tilt}
+        pose.pop(i, None)
+        poses[i] = pose
+    return poses
 
 
 class SmartBin(object):
     CONFIG = '/opt/picar-x/picar-x.conf'
 
-    P0_OPEN_ANGLE = 55
-    P1_OPEN_ANGLE = 40
-    P2_OPEN_ANGLE = 45
-    P3_OPEN_ANGLE = 55
-
-    SERVO_P0_MIN = -360
-    SERVO_P0_MAX = 360
-    SERVO_P1_MIN = -360
-    SERVO_P1_MAX = 360
-    SERVO_P2_MIN = -360
-    SERVO_P2_MAX = 360
-    SERVO_P3_MIN = -360
-    SERVO_P3_MAX = 360
+    PROFILE = 'smartbin'
+    # defaults until calibrated, per flap; extra flaps of larger bins get 0 / DEFAULT_OPEN_ANGLE
+    DEFAULT_CALIBRATION = (55., 90., -25., 80.)
+    DEFAULT_OPEN_ANGLES = (55., 40., 45., 55.)
+    DEFAULT_OPEN_ANGLE = 45.
+    CALIBRATION_FLUSH_DELAY = 2.0  # s, coalesces calibration writes
+
+    # flap opened -> {other flap: angle} it tilts towards it; None = ring_poses()
+    POSES = None
+    TILT_ANGLE = -30
+
+    MOTION_RATE = 50         # Hz
+    MOTION_EASING = 'ease_in_out'
+    OPEN_DURATION = 0.4      # s, target flap
+    TILT_DURATION = 0.3      # s, neighbouring flaps
+    TILT_DELAY = 0.2         # s after the target flap starts opening
+    CLOSE_DURATION = 0.4     # s
+    DWELL = 1.0              # s a flap stays open so the item can slide off the tray
+
+    FULLNESS_INTERVAL = 1.0  # s between ultrasonic samples
+    FULLNESS_WINDOW = 5      # samples in the running median
+    FULL_DISTANCE = 10.0     # cm, full below this
+    CLEAR_DISTANCE = 14.0    # cm, emptied again above this
+    BIN_DEPTH = 40.0         # cm, distance measured on an empty bin
+    COMPARTMENT_CAPACITY = 60  # items that nominally fill one compartment
+    FILL_SAVE_INTERVAL = 60.0  # s between fill state writes
+    BLINK_PERIOD = 0.3       # s
+    LED_PIN = 'D0'
+
+    SERVO_MIN = -360
+    SERVO_MAX = 360
 
     PERIOD = 4095
     PRESCALER = 10
     TIMEOUT = 0.02
 
-    # servo_pins: camera_pan_servo, camera_tilt_servo, direction_servo
+    # servo_pins: one pin per flap, 4 by default (6 or 8 for larger bins)
     # motor_pins: left_swicth, right_swicth, left_pwm, right_pwm
     # grayscale_pins: 3 adc channels
     # ultrasonic_pins: trig, echo2
     # config: path of config file
+    # profile: key prefix of this bin's values in the config file
     def __init__(self,
                  servo_pins: list = ['P0', 'P1', 'P2', 'P3'],
                  grayscale_pins: list = ['A0', 'A1', 'A2'],
                  ultrasonic_pins: list = ['D2', 'D3'],
                  config: str = CONFIG,
+                 profile: str = PROFILE,
+                 motion_rate: float = MOTION_RATE,
+                 motion_easing: str = MOTION_EASING,
+                 fullness_interval: float = FULLNESS_INTERVAL,
+                 fill_state: str = None,
+                 poses: dict = None,
                  ):
         # reset robot_hat
         utils.reset_mcu()
-        time.sleep(0.2)
-
-        # --------- config_flie ---------
-        self.config_flie = fileDB(config, 777, os.getlogin())
+        sleep(0.2)
+
+        # --------- calibration store ---------
+        self.calibration = CalibrationStore(config, profile=profile,
+                                            flush_delay=self.CALIBRATION_FLUSH_DELAY,
+                                            owner=_login(), timer=Timer)
+        n = len(servo_pins)
+        channels = range(n)
+        open_defaults = list(self.DEFAULT_OPEN_ANGLES[:n]) + [self.DEFAULT_OPEN_ANGLE] * (n - 4)
+        cali_defaults = list(self.DEFAULT_CALIBRATION[:n]) + [0.] * (n - 4)
+        self.open_angles = self.calibration.get_list('open_angle', channels, open_defaults)
 
         # --------- servos init ---------
-        self.servo_p0 = Servo(servo_pins[0])
-        self.servo_p1 = Servo(servo_pins[1])
-        self.servo_p2 = Servo(servo_pins[2])
-        self.servo_p3 = Servo(servo_pins[3])
-        # get calibration values
-        self.servo_p0_cali_val = float(self.config_flie.get("smartbin_servo_p0", default_value=55.))
-        self.servo_p1_cali_val = float(self.config_flie.get("smartbin_servo_p1", default_value=90.))
-        self.servo_p2_cali_val = float(self.config_flie.get("smartbin_servo_p2", default_value=-25.))
-        self.servo_p3_cali_val = float(self.config_flie.get("smartbin_servo_p3", default_value=80.))
-
-        # set servos to init angle
-        self.servo_p0.angle(self.servo_p0_cali_val)
-        self.servo_p1.angle(self.servo_p1_cali_val)
-        self.servo_p2.angle(self.servo_p2_cali_val)
-        self.servo_p3.angle(self.servo_p3_cali_val)
-
-        self.servo_p0_angle_ref = 0
-        self.servo_p1_angle_ref = 0
-        self.servo_p2_angle_ref = 0
-        self.servo_p3_angle_ref = 0
+        # get calibration values, then set servos to init angle
+        self.servos = ServoBank([Servo(pin) for pin in servo_pins],
+                                self.calibration.get_list('servo', channels, cali_defaults),
+                                lo=self.SERVO_MIN, hi=self.SERVO_MAX)
+        self.servos.apply()
+        self.poses = poses or self.POSES or ring_poses(n, self.TILT_ANGLE)
+
+        # --------- motion engine init ---------
+        self.motion = MotionEngine(self.servos, rate=motion_rate, easing=motion_easing,
+                                   clock=clock, sleep=sleep)
 
         # --------- ultrasonic init ---------
         trig, echo = ultrasonic_pins
         self.ultrasonic = Ultrasonic(Pin(trig), Pin(echo, mode=Pin.IN, pull=Pin.PULL_DOWN))
-
-
-
+        self._ultrasonic_lock = threading.Lock()
+
+        # --------- fullness monitor init ---------
+        self.led = None
+        self.blinker = Blinker(self._set_led, period=self.BLINK_PERIOD, wait=wait)
+        self.fullness = FullnessMonitor(self.get_distance, interval=fullness_interval,
+                                        window=self.FULLNESS_WINDOW, full_cm=self.FULL_DISTANCE,
+                                        clear_cm=self.CLEAR_DISTANCE, depth_cm=self.BIN_DEPTH,
+                                        wait=wait)
+        self.fullness.add_callback(self._on_fullness)
+
+        # --------- per-compartment fill model init ---------
+        self.fill = FillModel(n, capacity=self.COMPARTMENT_CAPACITY)
+        self.fill_state = fill_state
+        self._fill_saved = time.monotonic()
+        if fill_state is not None:
+            self.fill.load(fill_state)
+        self.fullness.add_sample_callback(lambda distance: self.fill.observe(self.fullness.level()))
+        self.fullness.start()
+
+
+    def servo_calibrate(self, channel, value):
+        '''
+        Sets the closed position of flap `channel` and moves it there.
+        '''
+        self.servos.calibrate(channel, value)
+        self.motion.sync({channel: 0.0})
+        self.calibration.set('servo', value, channel)
+
+    def set_servo_angle(self, channel, value):
+        self.set_servo_angles({channel: value})
+
+    def set_servo_angles(self, angles):
+        '''
+        Moves several flaps at once: {channel: angle} or one angle per flap.
+        '''
+        if not hasattr(angles, 'items'):
+            angles = dict(enumerate(angles))
+        self.servos.set_many(angles)
+        self.motion.sync({ch: self.servos.angle[ch] for ch in angles})
+
+    # per-pin methods of the four-flap API, kept for existing calibration scripts
     def servo_p0_servo_calibrate(self, value):
-        self.servo_p0_cali_val = value
-        self.config_flie.set("smartbin_servo_p0", "%s" % value)
-        self.servo_p0.angle(value)
+        self.servo_calibrate(0, value)
 
     def servo_p1_servo_calibrate(self, value):
-        self.servo_p1_cali_val = value
-        self.config_flie.set("smartbin_servo_p1", "%s" % value)
-        self.servo_p1.angle(value)
+        self.servo_calibrate(1, value)
 
     def servo_p2_servo_calibrate(self, value):
-        self.servo_p2_cali_val = value
-        self.config_flie.set("smartbin_servo_p2", "%s" % value)
-        self.servo_p2.angle(value)
+        self.servo_calibrate(2, value)
 
     def servo_p3_servo_calibrate(self, value):
-        self.servo_p3_cali_val = value
-        self.config_flie.set("smartbin_servo_p3", "%s" % value)
-        self.servo_p3.angle(value)
+        self.servo_calibrate(3, value)
 
     def set_servo_p0_angle(self, value):
-        value = constrain(value, self.SERVO_P0_MIN, self.SERVO_P0_MAX)
-        self.servo_p0_angle_ref = int(value)
-        self.servo_p0.angle(-1 * (value + -1 * self.servo_p0_cali_val))
+        self.set_servo_angle(0, value)
 
     def set_servo_p1_angle(self, value):
-        value = constrain(value, self.SERVO_P1_MIN, self.SERVO_P1_MAX)
-        self.servo_p1_angle_ref = int(value)
-        self.servo_p1.angle(-1 * (value + -1 * self.servo_p1_cali_val))
+        self.set_servo_angle(1, value)
 
     def set_servo_p2_angle(self, value):
-        value = constrain(value, self.SERVO_P2_MIN, self.SERVO_P2_MAX)
-        self.servo_p2_angle_ref = int(value)
-        self.servo_p2.angle(-1 * (value + -1 * self.servo_p2_cali_val))
+        self.set_servo_angle(2, value)
 
     def set_servo_p3_angle(self, value):
-        value = constrain(value, self.SERVO_P3_MIN, self.SERVO_P3_MAX)
-        self.servo_p3_angle_ref = int(value)
-        self.servo_p3.angle(-1 * (value + -1 * self.servo_p3_cali_val))
-
-    def open(self, pin_number):
-        if pin_number == 0:
-            for deg in range(0, self.P0_OPEN_ANGLE, self.P0_OPEN_ANGLE // 10):
-                self.set_servo_p0_angle(deg)
-                time.sleep(0.1)
-        elif pin_number == 1:
-            for deg in range(0, self.P1_OPEN_ANGLE, self.P1_OPEN_ANGLE // 10):
-                self.set_servo_p1_angle(deg)
-                time.sleep(0.1)
-        elif pin_number == 2:
-            for deg in range(0, self.P2_OPEN_ANGLE, self.P2_OPEN_ANGLE // 10):
-                self.set_servo_p2_angle(deg)
-                time.sleep(0.1)
-        elif pin_number == 3:
-            for deg in range(0, self.P3_OPEN_ANGLE, self.P3_OPEN_ANGLE // 10):
-                self.set_servo_p3_angle(deg)
-                time.sleep(0.1)
-
-        if pin_number == 0:
-            for deg in range(0, -40, -10):
-                self.set_servo_p2_angle(deg)
-                self.set_servo_p3_angle(deg // 2)
-                self.set_servo_p1_angle(deg // 2)
-                time.sleep(0.1)
-        elif pin_number == 1:
-            for deg in range(0, -40, -10):
-                self.set_servo_p3_angle(deg)
-                self.set_servo_p0_angle(deg // 2)
-                self.set_servo_p2_angle(deg // 2)
-                time.sleep(0.1)
-        elif pin_number == 2:
-            for deg in range(0, -40, -10):
-                self.set_servo_p0_angle(deg)
-                self.set_servo_p1_angle(deg // 2)
-                self.set_servo_p3_angle(deg // 2)
-                time.sleep(0.1)
-        elif pin_number == 3:
-            for deg in range(0, -40, -10):
-                self.set_servo_p1_angle(deg)
-                self.set_servo_p0_angle(deg // 2)
-                self.set_servo_p2_angle(deg // 2)
-                time.sleep(0.1)
-
-    def close_all(self):
-        p0_step = self.servo_p0_angle_ref // 10
-        p1_step = self.servo_p1_angle_ref // 10
-        p2_step = self.servo_p2_angle_ref // 10
-        p3_step = self.servo_p3_angle_ref // 10
-
-        for i in range(10):
-            if self.servo_p0_angle_ref != 0:
-                self.set_servo_p0_angle(self.servo_p0_angle_ref - p0_step)
-            if self.servo_p1_angle_ref != 0:
-                self.set_servo_p1_angle(self.servo_p1_angle_ref - p1_step)
-            if self.servo_p2_angle_ref != 0:
-                self.set_servo_p2_angle(self.servo_p2_angle_ref - p2_step)
-            if self.servo_p3_angle_ref != 0:
-                self.set_servo_p3_angle(self.servo_p3_angle_ref - p3_step)
-            time.sleep(0.1)
-        self.reset()
+        self.set_servo_angle(3, value)
+
+    def set_open_angle(self, pin_number, angle):
+        '''
+        Calibrates how far flap `pin_number` opens; persisted with the servo offsets.
+        '''
+        self.open_angles[pin_number] = angle
+        self.calibration.set('open_angle', angle, pin_number)
+
+    def save_calibration(self):
+        '''
+        Writes pending calibration changes now instead of after the flush delay.
+        '''
+        self.calibration.flush()
+
+    def open(self, pin_number, duration=None, easing=None):
+        '''
+        Opens flap `pin_number` and tilts the other flaps towards it.
+        Returns a MotionHandle; call join() (or await it) to wait for the move.
+        '''
+        if pin_number not in self.poses:
+            raise ValueError("no flap on pin %r" % (pin_number,))
+        open_duration = self.OPEN_DURATION if duration is None else duration
+        scale = open_duration / self.OPEN_DURATION if self.OPEN_DURATION else 0
+        tilt_delay = self.TILT_DELAY * scale
+        tilt_duration = self.TILT_DURATION * scale
+
+        self.fill.record(pin_number)
+        self._save_fill()
+        targets = dict(self.poses[pin_number])
+        targets[pin_number] = self.open_angles[pin_number]
+        delays = {ch: tilt_delay for ch in targets if ch != pin_number}
+        durations = {ch: tilt_duration for ch in targets if ch != pin_number}
+        return self.motion.move(targets, open_duration, easing=easing,
+                                delays=delays, durations=durations)
+
+    def dwell(self, seconds=None):
+        '''
+        Waits while a flap is open, on the hardware clock (scaled under the simulator).
+        '''
+        sleep(self.DWELL if seconds is None else seconds)
+
+    def close_all(self, duration=None, easing=None):
+        '''
+        Moves every flap back to its closed position. Returns a MotionHandle.
+        '''
+        duration = self.CLOSE_DURATION if duration is None else duration
+        return self.motion.move({ch: 0 for ch in self.motion.channels}, duration, easing=easing)
 
     def get_distance(self):
-        return self.ultrasonic.read()
+        # the fullness monitor and callers like the presence trigger share the sensor
+        with self._ultrasonic_lock:
+            return self.ultrasonic.read()
 
     def is_full(self):
-        dist = []
-        for i in range(10):
-            dist.append(self.get_distance())
-        distance = sum(dist) / 10.0
-        return distance < 10.0
-    
+        '''
+        Last state published by the fullness monitor; never touches the sensor.
+        '''
+        return self.fullness.full
+
+    def fill_level(self):
+        return self.fullness.level()
+
+    def fill_report(self):
+        '''
+        Estimated fill and forecast seconds-to-full per compartment, see FillModel.report().
+        '''
+        return self.fill.report()
+
+    def _save_fill(self, force=False):
+        if self.fill_state is None:
+            return
+        now = time.monotonic()
+        if force or now - self._fill_saved >= self.FILL_SAVE_INTERVAL:
+            self._fill_saved = now
+            self.fill.save(self.fill_state)
+
+    def _set_led(self, value):
+        if self.led is None:
+            self.led = Pin(self.LED_PIN)
+        self.led.value(value)
+
+    def _on_fullness(self, full, distance):
+        if full:
+            self.light_on()
+        else:
+            # cleared after being full: the bin was emptied
+            self.light_off()
+            self.fill.empty()
+
     def light_on(self):
-        self.led = Pin("D0")
-        while True:
-            self.led.value(1)
-            time.sleep(0.3)
-            self.led.value(0)
-            time.sleep(0.3)
+        '''
+        Starts blinking the LED in the background. Returns immediately.
+        '''
+        self.blinker.start()
+
+    def light_off(self):
+        self.blinker.stop()
 
     def check_fullness(self):
         if self.is_full():
@@ -204,13 +289,21 @@ class SmartBin(object):
         return False
 
     def stop(self):
-        pass
+        self.motion.cancel()
+
+    def close(self):
+        '''
+        Stops the background threads (motion, fullness monitor, LED).
+        '''
+        self.motion.shutdown()
+        self.fullness.stop()
+        self.light_off()
+        self._save_fill(force=True)
+        self.calibration.flush()
 
     def reset(self):
-        self.set_servo_p0_angle(0)
-        self.set_servo_p1_angle(0)
-        self.set_servo_p2_angle(0)
-        self.set_servo_p3_angle(0)
+        self.motion.cancel()
+        self.motion.move({ch: 0 for ch in self.motion.channels}, 0).join()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Lightweight per-stage tracing for the sorting loop.
+
+Code wraps each stage in `with tracer.span("invoke"):` (or records a
+measured duration). Every span updates a fixed-bucket histogram for its
+stage and is appended to a bounded ring buffer, so memory stays constant
+and the hot path is a perf_counter() pair, a bisect, an uncontended
+per-stage lock and a deque append.
+
+An exporter thread periodically writes either a Prometheus text file (for
+node_exporter's textfile collector; replaced atomically) or appends the
+spans recorded since the last export as JSON lines. A sampling profiler
+over all threads can be toggled at runtime with SIGUSR1; it writes
+collapsed stacks that flamegraph tools read directly.
+
+Stages used by classify_pi.py: capture, crops, preprocess, invoke,
+decision, actuation, fullness.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import itertools
+import traceback
+from bisect import bisect_left
+from collections import Counter, deque
+from pathlib import Path
+
+# histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        # spans are recorded from the capture, inference and actuation threads
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        i = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        """
+        Consistent (counts, sum, count) for export.
+        """
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self, capacity: int = 4096, enabled: bool = True):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity)   # (seq, wall time, stage, seconds)
+        self.histograms = {}
+        self._seq = itertools.count(1)
+        self._exported = 0
+        self._exporter = None
+        self._stop = threading.Event()
+        self.profiler = None
+        self.profile_out = "profile.folded"
+
+    def span(self, name: str):
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def record(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms.setdefault(name, Histogram())
+        hist.observe(seconds)
+        self.spans.append((next(self._seq), time.time(), name, seconds))
+
+    def timed(self, name: str, fn):
+        """
+        Wraps fn so every call is recorded as a `name` span.
+        """
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def summary(self) -> dict:
+        """
+        count/mean/p50/p95 in milliseconds per stage, over the ring buffer.
+        """
+        per_stage = {}
+        for _, _, name, seconds in list(self.spans):
+            per_stage.setdefault(name, []).append(seconds * 1e3)
+        out = {}
+        for name, ms in per_stage.items():
+            ms.sort()
+            out[name] = {"count": self.histograms[name].count,
+                         "mean_ms": round(sum(ms) / len(ms), 2),
+                         "p50_ms": round(ms[len(ms) // 2], 2),
+                         "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 2)}
+        return out
+
+    # ---- export ----
+
+    def prometheus_text(self) -> str:
+        lines = ["# HELP smartbin_stage_seconds Duration of sorting loop stages.",
+                 "# TYPE smartbin_stage_seconds histogram"]
+        for name, hist in sorted(list(self.histograms.items())):
+            counts, total, n = hist.snapshot()
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'smartbin_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'smartbin_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'smartbin_stage_seconds_count{{stage="{name}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path) -> None:
+        """
+        *.prom: rewrite the Prometheus text file; anything else: append the
+        spans recorded since the previous export as JSON lines.
+        """
+        path = Path(path)
+        if path.suffix == ".prom":
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(self.prometheus_text())
+            os.replace(tmp, path)
+            return
+        fresh = [s for s in list(self.spans) if s[0] > self._exported]
+        if not fresh:
+            return
+        with path.open("a") as f:
+            for seq, ts, name, seconds in fresh:
+                f.write(json.dumps({"ts": round(ts, 3), "stage": name, "ms": round(seconds * 1e3, 3)}) + "\n")
+        self._exported = fresh[-1][0]
+
+    def start_exporter(self, path, interval: float = 10.0) -> None:
+        def run():
+            while not self._stop.wait(interval):
+                self.export(path)
+            self.export(path)
+
+        self._stop.clear()
+        self._exporter = threading.Thread(target=run, name="metrics-export", daemon=True)
+        self._exporter.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._exporter is not None:
+            self._exporter.join()
+            self._exporter = None
+        if self.profiler is not None:
+            self.toggle_profiling()
+
+    # ---- profiling ----
+
+    def toggle_profiling(self, interval: float = 0.005) -> bool:
+        """
+        Starts the sampling profiler, or stops it and writes its collapsed
+        stacks to `profile_out`. Returns True while profiling.
+        """
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+            print(f"[Info] profiling started (every {interval * 1e3:.0f} ms)", file=sys.stderr)
+            return True
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+        profiler.dump(self.profile_out)
+        print(f"[Info] profiling stopped, {profiler.samples} samples written to {self.profile_out}",
+              file=sys.stderr)
+        return False
+
+    def install_signal_toggle(self, sig=getattr(signal, "SIGUSR1", None)) -> None:
+        """
+        `kill -USR1 <pid>` toggles the profiler.
+        """
+        if sig is not None:
+            signal.signal(sig, lambda *_: self.toggle_profiling())
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every `interval` seconds and
+    counts them; the cost is one sys._current_frames() walk per sample.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 10000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = ";".join(f"{fs.name} ({Path(fs.filename).name}:{fs.lineno})"
+                                 for fs in traceback.extract_stack(frame))
+                key = f"{names.get(ident, ident)};{stack}"
+                if key in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[key] += 1
+            self.samples += 1
+
+    def dump(self, path) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+tracer = Tracer()
+
+
+def add_tracing_args(parser) -> None:
+    group = parser.add_argument_group("metrics")
+    group.add_argument("--metrics", metavar="PATH",
+                       help="export stage timings: *.prom (Prometheus text) or *.jsonl (spans)")
+    group.add_argument("--metrics-interval", type=float, default=10.0, help="seconds between exports")
+    group.add_argument("--no-tracing", action="store_true", help="disable stage timing entirely")
+    group.add_argument("--profile-out", default="profile.folded",
+                       help="collapsed stacks written when SIGUSR1 stops the profiler")
+
+
+def setup_tracing(args) -> Tracer:
+    """
+    Configures the module-level tracer from the CLI and starts its exporter.
+    """
+    tracer.enabled = not args.no_tracing
+    if args.metrics and tracer.enabled:
+        tracer.start_exporter(args.metrics, args.metrics_interval)
+    tracer.profile_out = args.profile_out
+    tracer.install_signal_toggle()
+    return tracer
@@ -58,38 +58,83 @@
 """
 Fine‑tune MobileNetV3‑Small for 4‑class classification.
 Outputs: models/model.keras and models/saved_model/
-Run: python src/train_model.py
+Run: python src/train_model.py [--shards data/shards] [--cache-dir data/cache] [--augment]
+                                [--resume] [--cached-features] [--export]
+
+The input pipeline (data_pipeline.py) streams from data/images or from the
+record shards of `prepare_data.py --format shards`, decodes in parallel and
+caches to files only when --cache-dir is given, so memory stays bounded on
+large merged datasets. --benchmark-data measures input throughput without
+training.
+
+Both phases (frozen-base head, then fine-tuning) checkpoint every epoch
+under models/checkpoints/ and keep the best epoch by val_loss; --resume
+continues an interrupted run and skips a head phase that already finished.
+Early stopping and LR reduction watch val_loss. --cached-features computes
+the frozen MobileNetV3 embeddings once (data/features/) and trains the head
+on those vectors. --export hands the best model straight to export_model.
 """
+import argparse
+import json
+import shutil
+import numpy as np
 import tensorflow as tf
 from pathlib import Path
 from tensorflow.keras import layers as L
+from data_pipeline import make_dataset, benchmark, source_digest, IMG_SIZE
 
 # Constants
-AUTOTUNE = tf.data.AUTOTUNE
-IMG_SIZE = 224
 BATCH = 32
 EPOCHS = 20
+FINE_TUNE_EPOCHS = 5
+PATIENCE = 4
 
 data_dir = Path("data/images")
+CHECKPOINTS = Path("models/checkpoints")
+FEATURES = Path("data/features")
+SPLIT = Path("models/data_split.json")   # read by quantize_model.py
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--shards", type=Path, help="stream from a shard directory (see shards.py)")
+parser.add_argument("--cache-dir", type=Path, help="cache decoded images to files in this directory")
+parser.add_argument("--augment", action="store_true", help="random flip/crop/brightness/contrast")
+parser.add_argument("--batch", type=int, default=BATCH)
+parser.add_argument("--shuffle-buffer", type=int, default=1000)
+parser.add_argument("--mixed-precision", action="store_true",
+                    help="mixed_float16 policy with fixed-size training batches")
+parser.add_argument("--benchmark-data", type=int, metavar="BATCHES", nargs="?", const=100,
+                    help="only measure input pipeline throughput (images/sec) and exit")
+parser.add_argument("--epochs", type=int, default=EPOCHS, help="max epochs for the head phase")
+parser.add_argument("--fine-tune-epochs", type=int, default=FINE_TUNE_EPOCHS)
+parser.add_argument("--patience", type=int, default=PATIENCE, help="early-stopping patience (epochs)")
+parser.add_argument("--resume", action="store_true", help="continue from models/checkpoints (otherwise it is cleared)")
+parser.add_argument("--cached-features", action="store_true",
+                    help="train the head on precomputed frozen-base embeddings")
+parser.add_argument("--refresh-features", action="store_true", help="recompute cached embeddings")
+parser.add_argument("--export", action="store_true", help="run export_model on the best model")
+args = parser.parse_args()
+
+if args.mixed_precision:
+    tf.keras.mixed_precision.set_global_policy("mixed_float16")
 
 # Prepare datasets
-train_ds = tf.keras.utils.image_dataset_from_directory(
-    data_dir, validation_split=0.2, subset="training",
-    seed=42, image_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH)
+pipeline = dict(batch=args.batch, shards_dir=args.shards, cache_dir=args.cache_dir)
+train_ds, class_names = make_dataset(data_dir, "training", augment_data=args.augment,
+                                     shuffle_buffer=args.shuffle_buffer,
+                                     drop_remainder=args.mixed_precision, **pipeline)
+val_ds, _ = make_dataset(data_dir, "validation", **pipeline)
 
-val_ds = tf.keras.utils.image_dataset_from_directory(
-    data_dir, validation_split=0.2, subset="validation",
-    seed=42, image_size=(IMG_SIZE, IMG_SIZE), batch_size=BATCH)
+if args.benchmark_data:
+    benchmark(train_ds, batches=args.benchmark_data)
+    raise SystemExit(0)
 
 # Save class names
-class_names = train_ds.class_names
 Path("data").mkdir(exist_ok=True)
 with open("data/labels.txt", "w") as f:
     f.write("\n".join(class_names))
-
-# Optimize pipeline
-train_ds = train_ds.cache().shuffle(1000).prefetch(AUTOTUNE)
-val_ds = val_ds.cache().prefetch(AUTOTUNE)
+# record where the train/validation split came from, so quantization evaluates on the same one
+SPLIT.parent.mkdir(parents=True, exist_ok=True)
+SPLIT.write_text(json.dumps({"data_dir": str(data_dir), "shards": str(args.shards) if args.shards else None}))
 
 # Build model
 base = tf.keras.applications.MobileNetV3Small(
@@ -99,31 +144,121 @@ base.trainable = False
 inputs = L.Input(shape=(IMG_SIZE, IMG_SIZE, 3))
 x = tf.keras.applications.mobilenet_v3.preprocess_input(inputs)
 x = base(x, training=False)
-x = L.GlobalAveragePooling2D()(x)
-x = L.Dropout(0.2)(x)
-outputs = L.Dense(len(class_names), activation='softmax')(x)
+features = L.GlobalAveragePooling2D()(x)
+dropout = L.Dropout(0.2)
+# keep the softmax in float32 under mixed precision
+classifier = L.Dense(len(class_names), activation='softmax', dtype="float32")
+outputs = classifier(dropout(features))
 model = tf.keras.Model(inputs, outputs)
 
-# Compile and train head
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(1e-3),
-    loss="sparse_categorical_crossentropy",
-    metrics=["accuracy"]
-)
-model.fit(train_ds, validation_data=val_ds, epochs=EPOCHS)
+if not args.resume and CHECKPOINTS.exists():
+    shutil.rmtree(CHECKPOINTS)
+CHECKPOINTS.mkdir(parents=True, exist_ok=True)
 
-# Fine‑tune last layers
+
+def callbacks(phase):
+    """
+    Per-epoch resumable backup, best-epoch checkpoint, early stopping and LR
+    schedule, all keyed on val_loss.
+    """
+    return [
+        tf.keras.callbacks.BackupAndRestore(str(CHECKPOINTS/f"{phase}-backup")),
+        tf.keras.callbacks.ModelCheckpoint(str(CHECKPOINTS/f"{phase}-best.keras"),
+                                           monitor="val_loss", save_best_only=True),
+        tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=args.patience,
+                                         restore_best_weights=True),
+        tf.keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.3,
+                                             patience=max(1, args.patience // 2), min_lr=1e-7),
+        tf.keras.callbacks.CSVLogger(str(CHECKPOINTS/f"{phase}-log.csv"), append=True),
+    ]
+
+
+def restore_best(m, phase):
+    """
+    Loads the best checkpoint of a phase into `m`; EarlyStopping only
+    restores it when it actually stopped early.
+    """
+    best = CHECKPOINTS/f"{phase}-best.keras"
+    if best.exists():
+        m.load_weights(best)
+
+
+def embed(subset):
+    """
+    Frozen-base embeddings of a split, computed once and cached under data/features/.
+    """
+    path = FEATURES/f"{subset}.npz"
+    source = str(args.shards or data_dir)
+    digest = source_digest(source)
+    if path.exists() and not args.refresh_features:
+        cached = np.load(path)
+        if (str(cached["source"]) == source and list(cached["classes"]) == class_names
+                and "digest" in cached.files and str(cached["digest"]) == digest):
+            return cached["x"], cached["y"]
+    FEATURES.mkdir(parents=True, exist_ok=True)
+    ds = train_ds_plain if subset == "training" else val_ds
+    extractor = tf.keras.Model(inputs, features)
+    xs, ys = [], []
+    for images, labels in ds:
+        xs.append(extractor(images, training=False).numpy().astype(np.float32))
+        ys.append(labels.numpy())
+    x, y = np.concatenate(xs), np.concatenate(ys)
+    np.savez(path, x=x, y=y, source=source, classes=np.array(class_names), digest=digest)
+    return x, y
+
+
+# Phase 1: train the head on the frozen base
+head_done = CHECKPOINTS/"head.weights.h5"
+if args.resume and head_done.exists():
+    print(f"Head phase already finished, loading {head_done}")
+    model.load_weights(head_done)
+elif args.cached_features:
+    if args.augment:
+        print("[Warning] --augment has no effect on cached features")
+    train_ds_plain, _ = make_dataset(data_dir, "training", **pipeline)
+    x_train, y_train = embed("training")
+    x_val, y_val = embed("validation")
+    feat_in = L.Input(shape=x_train.shape[1:])
+    head = tf.keras.Model(feat_in, classifier(dropout(feat_in)))   # shares weights with `model`
+    head.compile(optimizer=tf.keras.optimizers.Adam(1e-3),
+                 loss="sparse_categorical_crossentropy", metrics=["accuracy"])
+    head.fit(x_train, y_train, validation_data=(x_val, y_val), epochs=args.epochs,
+             batch_size=args.batch, shuffle=True, callbacks=callbacks("head"))
+    restore_best(head, "head")
+    model.save_weights(head_done)
+else:
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(1e-3),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=callbacks("head"))
+    restore_best(model, "head")
+    model.save_weights(head_done)
+
+# Phase 2: fine‑tune last layers
 base.trainable = True
 model.compile(
     optimizer=tf.keras.optimizers.Adam(1e-5),
     loss="sparse_categorical_crossentropy",
     metrics=["accuracy"]
 )
-model.fit(train_ds, validation_data=val_ds, epochs=5)
+history = model.fit(train_ds, validation_data=val_ds, epochs=args.fine_tune_epochs,
+                    callbacks=callbacks("finetune"))
 
-# Save models
+# Save models from the best fine-tune epoch
+restore_best(model, "finetune")
 Path("models").mkdir(exist_ok=True)
 # Keras native format
 model.save("models/model.keras")
-# TensorFlow SavedModel for TFLite conversion
-model.save("models/saved_model", include_optimizer=False)
+best_epoch = int(np.argmin(history.history["val_loss"])) if history.history.get("val_loss") else -1
+best = {k: float(v[best_epoch]) for k, v in history.history.items() if v}
+(CHECKPOINTS/"best.json").write_text(json.dumps(best, indent=2))
+print(f"✓ Best model saved to models/model.keras: {best}")
+
+if args.export:
+    from export_model import export
+    export(model=model)
+else:
+    # TensorFlow SavedModel for TFLite conversion
+    model.export("models/saved_model")
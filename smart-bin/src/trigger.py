@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Event-driven presence trigger: wake the classifier only when an item lands.
+
+Frames are reduced to a small grayscale thumbnail (stride sampling, no cv2)
+and compared pixel by pixel with a slowly adapting background of the empty
+tray. When the fraction of changed pixels (|difference| above a gray-level
+threshold) exceeds `on_fraction`, so even an item covering a few percent of
+the frame counts, and the scene then holds still for a few frames, one
+"arrived" event fires; the trigger re-arms once the tray matches the
+background again. Only pixels that currently match the background adapt to
+it, so an item that was missed is never absorbed into the empty tray. While idle the camera is polled at a low rate, so an
+empty bin spends almost no CPU. An optional presence() callable (e.g. an
+ultrasonic reading) must also confirm before an arrival fires.
+"""
+import time
+import numpy as np
+
+EMPTY, SETTLING, PRESENT = "empty", "settling", "present"
+# valid ultrasonic range, as in smartbin.fullness.FullnessMonitor; timeouts read as negative values
+MIN_CM, MAX_CM = 2.0, 400.0
+
+
+class PresenceTrigger:
+    def __init__(self, stride: int = 8, pixel_threshold: float = 25.0, on_fraction: float = 0.01,
+                 off_fraction: float = 0.005, still_fraction: float = 0.003, stable_frames: int = 3,
+                 background_alpha: float = 0.05, idle_interval: float = 0.25, active_interval: float = 0.03,
+                 presence=None):
+        self.stride = stride
+        self.pixel_threshold = pixel_threshold
+        self.on_fraction = on_fraction
+        self.off_fraction = off_fraction
+        self.still_fraction = still_fraction
+        self.stable_frames = stable_frames
+        self.background_alpha = background_alpha
+        self.idle_interval = idle_interval
+        self.active_interval = active_interval
+        self.presence = presence
+        self.ultrasonic_cm = None
+        self.state = EMPTY
+        self.background = None
+        self._prev = None
+        self._still = 0
+        self._clear = 0
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        small = frame[::self.stride, ::self.stride]
+        return small.mean(axis=2, dtype=np.float32) if small.ndim == 3 else small.astype(np.float32)
+
+    def update(self, frame: np.ndarray) -> bool:
+        """
+        Feeds one frame; returns True exactly once per item, when it has
+        landed and stopped moving.
+        """
+        thumb = self.thumbnail(frame)
+        if self.background is None:
+            self.background = thumb.copy()
+            self._prev = thumb
+            return False
+        changed = np.abs(thumb - self.background) > self.pixel_threshold
+        to_bg = float(changed.mean())
+        motion = float((np.abs(thumb - self._prev) > self.pixel_threshold).mean())
+        self._prev = thumb
+        fired = False
+
+        if self.state == EMPTY:
+            if to_bg > self.on_fraction:
+                self.state, self._still = SETTLING, 0
+            else:
+                # follow slow lighting changes of the empty tray, but not of pixels that differ now
+                static = ~changed
+                self.background[static] += self.background_alpha * (thumb[static] - self.background[static])
+        elif self.state == SETTLING:
+            if to_bg < self.off_fraction:
+                self.state = EMPTY
+            elif motion < self.still_fraction:
+                self._still += 1
+                if self._still >= self.stable_frames and (self.presence is None or self.presence()):
+                    self.state, self._clear = PRESENT, 0
+                    fired = True
+            else:
+                self._still = 0
+        elif self.state == PRESENT:
+            self._clear = self._clear + 1 if to_bg < self.off_fraction else 0
+            if self._clear >= self.stable_frames:
+                self.state = EMPTY
+        return fired
+
+    def use_distance(self, distance, below_cm: float) -> None:
+        """
+        Require distance() (e.g. SmartBin.get_distance) < below_cm to confirm an item.
+        Invalid readings (timeouts, errors, out of range) never confirm one.
+        """
+        self.ultrasonic_cm = below_cm
+
+        def presence():
+            try:
+                value = distance()
+            except Exception:
+                return False
+            return value is not None and MIN_CM <= value <= MAX_CM and value < below_cm
+        self.presence = presence
+
+    def interval(self) -> float:
+        return self.active_interval if self.state == SETTLING else self.idle_interval
+
+    def wait(self, capture, burst: int = 1):
+        """
+        Polls capture() until an item arrives. Returns the triggering frame,
+        or a list of `burst` frames starting with it when burst > 1.
+        """
+        while True:
+            frame = capture()
+            if self.update(frame):
+                if burst <= 1:
+                    return frame
+                return [frame] + [capture() for _ in range(burst - 1)]
+            time.sleep(self.interval())
+
+
+def add_trigger_args(parser) -> None:
+    group = parser.add_argument_group("presence trigger")
+    group.add_argument("--trigger", action="store_true",
+                       help="only classify when an item lands on the tray and stays still")
+    group.add_argument("--trigger-threshold", type=float, default=25.0,
+                       help="gray-level change of a pixel vs. the empty tray that counts as changed")
+    group.add_argument("--trigger-fraction", type=float, default=0.01,
+                       help="fraction of changed pixels that counts as an item")
+    group.add_argument("--trigger-idle-interval", type=float, default=0.25,
+                       help="seconds between frames while the tray is empty")
+    group.add_argument("--trigger-ultrasonic", type=float, metavar="CM",
+                       help="also require the ultrasonic distance to drop below CM")
+
+
+def trigger_from_args(args):
+    """
+    PresenceTrigger from the CLI, or None. The ultrasonic confirmation is
+    recorded in `ultrasonic_cm` and wired up with use_distance() once the
+    SmartBin exists.
+    """
+    if not args.trigger:
+        return None
+    trigger = PresenceTrigger(pixel_threshold=args.trigger_threshold, on_fraction=args.trigger_fraction,
+                              off_fraction=args.trigger_fraction / 2,
+                              idle_interval=args.trigger_idle_interval)
+    trigger.ultrasonic_cm = args.trigger_ultrasonic
+    return trigger
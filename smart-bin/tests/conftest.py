@@ -0,0 +1,22 @@
+'''
+Tests run against the simulated hardware (src/smartbin/sim.py) with time
+accelerated, so they need neither a Pi nor real servo travel time.
+Run from smart-bin/: python -m pytest -q tests
+'''
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("SMARTBIN_SIM", "1")
+os.environ.setdefault("SMARTBIN_SIM_SPEED", "20")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]/"src"))
+
+import pytest
+
+
+@pytest.fixture
+def smart_bin(tmp_path):
+    from smartbin import SmartBin
+    bin = SmartBin(config=str(tmp_path/"smartbin.conf"))
+    yield bin
+    bin.close()
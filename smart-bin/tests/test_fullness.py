@@ -0,0 +1,83 @@
+import threading
+
+from smartbin.fullness import FullnessMonitor, Blinker
+from smartbin.hardware import wait, sleep
+
+
+def scripted(readings):
+    readings = iter(readings)
+    return lambda: next(readings)
+
+
+def test_hysteresis_between_full_and_clear():
+    monitor = FullnessMonitor(scripted([20, 20, 9, 9, 9, 12, 12, 12, 13, 15, 15, 15]),
+                              window=3, full_cm=10, clear_cm=14)
+    changes = []
+    monitor.add_callback(lambda full, distance: changes.append((full, distance)))
+    states = []
+    for _ in range(12):
+        monitor.sample()
+        states.append(monitor.full)
+    # full once the median of 3 drops below 10; 12-13 cm is between the
+    # thresholds and keeps it full; clear only once the median exceeds 14
+    assert states == [False, False, False, True, True, True, True, True, True, True, False, False]
+    assert changes == [(True, 9), (False, 15)]
+
+
+def test_invalid_readings_are_dropped():
+    def read():
+        raise OSError("no echo")
+    monitor = FullnessMonitor(scripted([-1, 0, 30, -2, 500, 30]), window=3)
+    for _ in range(6):
+        monitor.sample()
+    assert monitor.errors == 4
+    assert list(monitor.samples) == [30, 30]
+    failing = FullnessMonitor(read)
+    assert failing.sample() is None and failing.errors == 1
+
+
+def test_level_is_none_before_the_first_sample():
+    monitor = FullnessMonitor(scripted([-1, 40]), depth_cm=40)
+    monitor.sample()
+    assert monitor.level() is None
+    monitor.sample()
+    assert monitor.level() == 0.0
+
+
+def test_level_reaches_one_where_the_bin_reports_full():
+    monitor = FullnessMonitor(scripted([25, 9.5]), window=1, full_cm=10, depth_cm=40)
+    monitor.sample()
+    assert monitor.level() == 0.5 and not monitor.full
+    monitor.sample()
+    assert monitor.level() == 1.0 and monitor.full
+
+
+def test_background_thread_samples_on_the_sim_clock():
+    sampled = threading.Event()
+    count = []
+
+    def read():
+        count.append(1)
+        if len(count) >= 3:
+            sampled.set()
+        return 30.0
+    # 1 s interval; the simulated clock runs faster than real time
+    monitor = FullnessMonitor(read, interval=1.0, wait=wait).start()
+    try:
+        assert sampled.wait(timeout=2.0)
+    finally:
+        monitor.stop()
+    assert monitor.distance == 30.0 and not monitor.full
+
+
+def test_blinker_toggles_and_ends_off():
+    values = []
+    blinker = Blinker(values.append, period=0.1, wait=wait)
+    blinker.stop()              # never started: no output touched
+    assert values == []
+    blinker.start()
+    sleep(1.0)
+    assert blinker.is_on()
+    blinker.stop()
+    assert not blinker.is_on()
+    assert 1 in values and values[-1] == 0
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from smartbin.hardware import clock, sleep
+from smartbin.motion import MotionEngine
+
+
+class Recorder(object):
+    '''
+    Setters for MotionEngine that record every write per channel.
+    '''
+
+    def __init__(self, channels):
+        self.writes = {ch: [] for ch in channels}
+        self.order = []     # channel of every write, in order
+        self.lock = threading.Lock()
+
+    def setters(self):
+        return {ch: (lambda value, ch=ch: self._write(ch, value)) for ch in self.writes}
+
+    def _write(self, ch, value):
+        with self.lock:
+            self.writes[ch].append(value)
+            self.order.append(ch)
+
+
+@pytest.fixture
+def engine():
+    recorder = Recorder(range(4))
+    engine = MotionEngine(recorder.setters(), rate=50, clock=clock, sleep=sleep)
+    engine.recorder = recorder
+    yield engine
+    engine.shutdown()
+
+
+def test_move_reaches_targets_monotonically(engine):
+    handle = engine.move({0: 45, 1: -15}, 0.4)
+    assert handle.join(timeout=5)
+    assert not handle.cancelled
+    assert engine.positions == {0: 45.0, 1: -15.0, 2: 0.0, 3: 0.0}
+    opening, tilting = engine.recorder.writes[0], engine.recorder.writes[1]
+    assert opening[-1] == 45 and tilting[-1] == -15
+    assert opening == sorted(opening) and tilting == sorted(tilting, reverse=True)
+    assert engine.recorder.writes[2] == []
+
+
+def test_delayed_track_starts_after_the_others(engine):
+    engine.move({0: 40, 1: 20}, 0.2, delays={1: 0.3}).join(timeout=5)
+    writes = engine.recorder.writes
+    assert writes[0][-1] == 40 and writes[1][-1] == 20
+    # channel 0 finished (0.2 s) before channel 1 started (0.3 s)
+    order = engine.recorder.order
+    assert len(order) - 1 - order[::-1].index(0) < order.index(1)
+
+
+def test_motions_play_back_to_back(engine):
+    first = engine.move({0: 30}, 0.2)
+    second = engine.move({0: 0}, 0.2)
+    assert second.join(timeout=5)
+    assert first.done() and not first.cancelled
+    writes = engine.recorder.writes[0]
+    peak = writes.index(30)
+    assert writes[:peak + 1] == sorted(writes[:peak + 1])
+    assert writes[peak:] == sorted(writes[peak:], reverse=True)
+
+
+def test_cancel_halts_and_retargets_from_current_position(engine):
+    slow = engine.move({0: 90}, 10.0)
+    queued = engine.move({0: 0}, 10.0)
+    while not engine.recorder.writes[0]:
+        sleep(0.05)
+    sleep(1.0)
+    engine.cancel()
+    assert slow.join(timeout=1) and slow.cancelled
+    assert queued.join(timeout=1) and queued.cancelled
+    halted = engine.positions[0]
+    assert 0 < halted < 90
+    count = len(engine.recorder.writes[0])
+
+    assert engine.move({0: -20}, 0.2).join(timeout=5)
+    retarget = engine.recorder.writes[0][count:]
+    assert retarget[-1] == -20
+    # no jump back to 0 or on to 90: the new motion starts where the flap stopped
+    assert retarget[0] <= halted and retarget == sorted(retarget, reverse=True)
+
+
+def test_handle_can_be_awaited(engine):
+    async def main():
+        await engine.move({2: 10}, 0.1)
+        return engine.positions[2]
+    assert asyncio.run(main()) == 10.0
+
+
+def test_sync_sets_the_start_of_the_next_motion(engine):
+    engine.sync({3: 25})
+    engine.move({3: 35}, 0.1).join(timeout=5)
+    assert all(25 <= value <= 35 for value in engine.recorder.writes[3])
+
+
+def test_unknown_channel(engine):
+    with pytest.raises(KeyError):
+        engine.move({7: 10}, 0.1)
@@ -0,0 +1,83 @@
+import pytest
+
+from smartbin.servo_bank import ServoBank
+from smartbin.smartbin import ring_poses
+
+
+class FakeServo(object):
+    def __init__(self):
+        self.raw = []
+
+    def angle(self, value):
+        self.raw.append(value)
+
+
+@pytest.fixture
+def bank():
+    return ServoBank([FakeServo() for _ in range(4)], [55., 90., -25., 80.], lo=-40, hi=60)
+
+
+def test_set_many_clamps_and_applies_offsets(bank):
+    bank.set_many({0: 30, 1: 100, 2: -90})
+    assert list(bank.angle) == [30, 60, -40, 0]
+    assert [s.raw for s in bank.servos] == [[25], [30], [15], []]
+
+
+def test_set_many_writes_only_changed_channels(bank):
+    bank.set_many([10, 10, 10, 10])
+    writes = bank.writes
+    bank.set_many([10, 10, 20, 10])
+    assert bank.writes == writes + 1
+    assert bank.servos[2].raw == [-35, -45]
+
+
+def test_calibrate_moves_to_the_new_closed_position(bank):
+    bank.set(1, 20)
+    bank.calibrate(1, 85)
+    assert bank.angle[1] == 0 and bank.servos[1].raw[-1] == 85
+    bank.set(1, 20)
+    assert bank.servos[1].raw[-1] == 65
+
+
+def test_apply_resends_every_channel(bank):
+    bank.set_many([5, 6, 7, 8])
+    bank.apply()
+    assert [s.raw[-1] for s in bank.servos] == [50, 84, -32, 72]
+    assert all(len(s.raw) == 2 for s in bank.servos)
+
+
+def test_mismatched_offsets():
+    with pytest.raises(ValueError):
+        ServoBank([FakeServo()], [1., 2.])
+
+
+def test_open_and_close_pose_sequence(smart_bin):
+    n = len(smart_bin.servos)
+    poses = ring_poses(n, smart_bin.TILT_ANGLE)
+    for flap in range(n):
+        assert smart_bin.open(flap).join(timeout=5)
+        expected = [0.0] * n
+        for ch, angle in poses[flap].items():
+            expected[ch] = angle
+        expected[flap] = smart_bin.open_angles[flap]
+        assert list(smart_bin.servos.angle) == expected
+        # the simulated servos were commanded to the calibrated raw angles
+        assert [s.target for s in smart_bin.servos.servos] == \
+            [off - a for off, a in zip(smart_bin.servos.offset, expected)]
+        assert smart_bin.close_all().join(timeout=5)
+        assert list(smart_bin.servos.angle) == [0.0] * n
+
+
+def test_ring_poses_tilt_towards_the_open_flap():
+    poses = ring_poses(4, -30)
+    assert poses[0] == {3: -15, 1: -15, 2: -30}
+    assert all(flap not in pose for flap, pose in poses.items())
+    assert ring_poses(8, -30)[0] == {7: -15, 1: -15, 4: -30}
+
+
+def test_calibration_resyncs_the_motion_engine(smart_bin):
+    smart_bin.open(1).join(timeout=5)
+    smart_bin.servo_calibrate(1, 70)
+    assert smart_bin.motion.positions[1] == 0.0
+    smart_bin.open(1).join(timeout=5)
+    assert smart_bin.servos.servos[1].target == 70 - smart_bin.open_angles[1]